@@ -0,0 +1,313 @@
+import argparse, json, logging, multiprocessing, os, platform, random, resource, signal, subprocess, time, traceback
+from itertools import product
+from typing import Dict, Iterator, List, Optional
+from pyboolnet import find_command
+from pyboolnet.file_exchange import bnet2primes
+from pyboolnet.repository import get_primes
+from pyboolnet.trap_spaces import compute_trap_spaces
+from control_strategies_parallel import compute_control_strategies_with_completeness, compute_control_strategies_with_model_checking, compute_control_strategies_with_model_checking_parallel, compute_control_strategies_with_model_checking_chunked, set_model_checker
+from control_strategies_trap_spaces import run_control_problem
+from instrumentation import enable
+from percolation_engine import PercolationEngine
+from steady_states import load_subspaces
+
+log = logging.getLogger(__name__)
+
+ENGINES = ["completeness", "model_checking", "parallel", "chunked", "trap_spaces"]
+PHENOTYPES = ["E1", "H1", "H2", "H3", "M1", "M2", "M3", "UN", "AVOID_H"]
+CMD_NUSMV = find_command("nusmv")
+
+
+# --- Networks and targets ------------------------------------------------------------
+
+def random_network(n: int, k: int, seed: int = 0) -> dict:
+    """
+    Returns the primes of a random Boolean network with *n* nodes x1..xn, each with *k* distinct regulators
+    and a random truth table. The same (*n*, *k*, *seed*) always give the same network.
+
+    **example**::
+        >>> primes = random_network(20, 2, seed=1)
+    """
+
+    rng = random.Random(f"{n}-{k}-{seed}")
+    names = [f"x{i}" for i in range(1, n + 1)]
+    lines = []
+    for name in names:
+        regulators = rng.sample(names, min(k, n))
+        terms = [" & ".join(r if bit else "!" + r for r, bit in zip(regulators, row))
+                 for row in product((0, 1), repeat=len(regulators)) if rng.random() < 0.5]
+        lines.append(f"{name}, " + (" | ".join(terms) if terms else "0"))
+    return bnet2primes("\n".join(lines))
+
+
+def random_target(primes: dict, size: int = 3, seed: int = 0) -> List[dict]:
+    """
+    Returns a phenotype-like target for a random network: up to *size* variables of a random non-empty minimal
+    trap space, with their values there. Variables that separate it from the other minimal trap spaces come first,
+    so that the target is not reached without control whenever the network has several. Empty if there is no such trap space.
+    """
+
+    rng = random.Random(seed)
+    spaces = [x for x in compute_trap_spaces(primes, "min") if x]
+    if not spaces:
+        return []
+    ts = rng.choice(spaces)
+    separating = sorted(v for v in ts if any(v in x and x[v] != ts[v] for x in spaces))
+    rest = sorted(v for v in ts if v not in separating)
+    chosen = rng.sample(separating, min(size, len(separating)))
+    chosen += rng.sample(rest, min(size - len(chosen), len(rest)))
+    return [{v: ts[v] for v in sorted(chosen)}]
+
+
+def emt_suite() -> Iterator[dict]:
+    """
+    Yields the selvaggio_emt benchmark networks: one per phenotype of parallel_node_control.py and AVOID_H.
+    The phenotype variables are not used as interventions, as in the control scripts.
+    """
+
+    primes = get_primes("selvaggio_emt")
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parallel_node_control.py")
+    for name in PHENOTYPES:
+        yield {"network": "selvaggio_emt", "primes": primes, "target_name": name, "target": load_subspaces(f"{path}:{name}")}
+
+
+def random_suite(sizes: List[int], k: int = 2, seeds: List[int] = (0,)) -> Iterator[dict]:
+    """
+    Yields random benchmark networks of the given *sizes* (see :func:`random_network` and :func:`random_target`).
+    """
+
+    for n in sizes:
+        for seed in seeds:
+            primes = random_network(n, k, seed)
+            target = random_target(primes, seed=seed)
+            if target:
+                yield {"network": f"random_n{n}_k{k}_s{seed}", "primes": primes, "target_name": "ts_min", "target": target}
+            else:
+                log.warning(f"random_n{n}_k{k}_s{seed}: no non-trivial minimal trap space, skipped")
+
+
+# --- Measuring one run -----------------------------------------------------------------
+
+class _Counters:
+    """Counters shared by a benchmark run and all its (forked) workers."""
+
+    def __init__(self):
+        self.nusmv = multiprocessing.Value("q", 0)
+        self.percolations = multiprocessing.Value("q", 0)
+
+    def add(self, counter, n: int = 1):
+        with counter.get_lock():
+            counter.value += n
+
+
+def _instrument(counters: _Counters):
+    """
+    Counts NuSMV processes and percolations in this process and in the processes it forks.
+    Only ever called in the child process of a run, so the patches never outlive it.
+    """
+
+    class CountingPopen(subprocess.Popen):
+        def __init__(self, args, *rest, **kwargs):
+            if args and args[0] == CMD_NUSMV:
+                counters.add(counters.nusmv)
+            super().__init__(args, *rest, **kwargs)
+
+    percolate, percolate_batch = PercolationEngine.percolate, PercolationEngine.percolate_batch
+
+    def counting_percolate(self, sub, *args, **kwargs):
+        counters.add(counters.percolations)
+        return percolate(self, sub, *args, **kwargs)
+
+    def counting_percolate_batch(self, cands, *args, **kwargs):
+        counters.add(counters.percolations, len(cands))
+        return percolate_batch(self, cands, *args, **kwargs)
+
+    subprocess.Popen = CountingPopen
+    PercolationEngine.percolate, PercolationEngine.percolate_batch = counting_percolate, counting_percolate_batch
+
+
+def run_engine(engine: str, primes: dict, target: List[dict], limit: int, n_jobs: int = 1) -> Optional[List[dict]]:
+    """
+    Runs one control-strategy engine, avoiding the target variables as interventions. Returns None if *engine*
+    does not handle *target* (completeness and the ASP trap-space method need a single subspace).
+    """
+
+    avoid = sorted({v for t in target for v in t})
+    if engine == "completeness":
+        return compute_control_strategies_with_completeness(primes, target[0], limit=limit, avoid=avoid) if len(target) == 1 else None
+    if engine == "model_checking":
+        return compute_control_strategies_with_model_checking(primes, target, limit=limit, avoid=avoid)
+    if engine == "parallel":
+        return compute_control_strategies_with_model_checking_parallel(primes, target, limit=limit, avoid=avoid, n_jobs=n_jobs)
+    if engine == "chunked":
+        return compute_control_strategies_with_model_checking_chunked(primes, target, limit=limit, avoid=avoid, n_jobs=n_jobs)
+    if engine == "trap_spaces":
+        return run_control_problem(primes, target[0], "node", "trap_spaces", avoid_nodes=avoid, limit=limit) if len(target) == 1 else None
+    raise ValueError(f"Unknown engine {engine}, expected one of {ENGINES}.")
+
+
+def _child(conn, counters: _Counters, engine: str, primes: dict, target: List[dict], limit: int, n_jobs: int, profile: bool):
+    os.setpgrp()  # so that a timeout can kill NuSMV and the pool workers as well
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1), os.dup2(devnull, 2)  # progress bars and prints of the engines
+    _instrument(counters)
+    recorder = enable() if profile else None
+    start = time.perf_counter()
+    try:
+        strategies = run_engine(engine, primes, target, limit, n_jobs)
+        result = {"status": "skipped" if strategies is None else "ok", "strategies": strategies}
+    except Exception:
+        result = {"status": "error", "error": traceback.format_exc()}
+    result["wall"] = time.perf_counter() - start
+    if recorder is not None:
+        stages = recorder.snapshot()
+        result["stages"] = {"stages": stages["stages"], "counters": stages["counters"]}
+    result["peak_rss_mb"] = max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) / 1024
+    conn.send(result)
+
+
+def measure(engine: str, primes: dict, target: List[dict], limit: int, n_jobs: int = 1, timeout: Optional[float] = None, profile: bool = False) -> dict:
+    """
+    Runs :func:`run_engine` in a fresh forked process, so that caches, counters and peak RSS belong to this run only.
+    With *profile* the stage timings of :mod:`instrumentation` are recorded as well ("stages").
+
+    **returns**:
+        * *result* (dict): "status" ("ok", "skipped", "error" or "timeout"), "wall" (seconds), "nusmv_calls",
+          "percolations", "peak_rss_mb" (largest of the run and its subprocesses) and "strategies".
+    """
+
+    ctx = multiprocessing.get_context("fork")
+    counters = _Counters()
+    receive, send = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_child, args=(send, counters, engine, primes, target, limit, n_jobs, profile))
+    start = time.perf_counter()
+    proc.start()
+    if receive.poll(timeout):
+        result = receive.recv()
+    else:
+        result = {"status": "timeout", "wall": time.perf_counter() - start, "peak_rss_mb": None, "strategies": None}
+        os.killpg(proc.pid, signal.SIGKILL)
+    proc.join()
+    result.update(nusmv_calls=counters.nusmv.value, percolations=counters.percolations.value)
+    return result
+
+
+# --- Suites and result files ---------------------------------------------------------
+
+def _environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "python": platform.python_version(), "cpus": os.cpu_count(), "host": platform.node()}
+
+
+def _encode_strategy(cs: dict) -> list:
+    return sorted(([list(k), v] if isinstance(k, tuple) else [k, v] for k, v in cs.items()), key=repr)
+
+
+def run_benchmarks(cases: Iterator[dict], engines: List[str], limits: List[int], out: str, n_jobs: int = 1, timeout: Optional[float] = None, profile: bool = False,
+                   model_checker: str = "nusmv") -> List[dict]:
+    """
+    Measures every engine at every limit on every case of a suite and appends one JSON line per run to *out*.
+    The model-checking engines decide their queries with *model_checker* ("nusmv" or "bdd", see set_model_checker).
+    Each record holds the network, target, engine, limit, the measurements of :func:`measure`, the number of
+    strategies per size and the strategies themselves, so that later runs can be compared (see :func:`compare`).
+
+    **example**::
+        >>> run_benchmarks(emt_suite(), ["model_checking", "trap_spaces"], [1, 2], "benchmarks.jsonl")
+    """
+
+    set_model_checker(model_checker)
+    environment = _environment()
+    records = []
+    with open(out, "a") as f:
+        for case in cases:
+            for engine in engines:
+                for limit in limits:
+                    result = measure(engine, case["primes"], case["target"], limit, n_jobs, timeout, profile)
+                    strategies = result.pop("strategies")
+                    record = {"network": case["network"], "nodes": len(case["primes"]), "target_name": case["target_name"], "target": case["target"],
+                              "engine": engine, "limit": limit, "n_jobs": n_jobs if engine in ("parallel", "chunked") else 1, "model_checker": model_checker, **result,
+                              "found": None if strategies is None else len(strategies),
+                              "by_size": None if strategies is None else {str(i): sum(len(cs) == i for cs in strategies) for i in range(limit + 1)},
+                              "strategies": None if strategies is None else sorted(map(_encode_strategy, strategies)),
+                              "time": time.strftime("%Y-%m-%dT%H:%M:%S"), **environment}
+                    f.write(json.dumps(record) + "\n")
+                    f.flush()
+                    records.append(record)
+                    log.info(f"{case['network']} {case['target_name']} {engine} limit={limit}: {result['status']}, {result['wall']:.1f}s, "
+                             f"{record['found']} strategies, {result['nusmv_calls']} NuSMV calls, {result['percolations']} percolations")
+    return records
+
+
+def load_benchmarks(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(old: str, new: str) -> List[dict]:
+    """
+    Matches the runs of two result files by (network, target, engine, limit) (the last run of each wins) and
+    returns, for each match, the time and NuSMV-call ratios new/old and whether the strategies agree.
+    """
+
+    def key(r):
+        return r["network"], r["target_name"], r["engine"], r["limit"]
+
+    before = {key(r): r for r in load_benchmarks(old)}
+    rows = []
+    for r in {key(r): r for r in load_benchmarks(new)}.values():
+        b = before.get(key(r))
+        if b is None or "ok" not in (b["status"], r["status"]):
+            continue
+        rows.append({"network": r["network"], "target_name": r["target_name"], "engine": r["engine"], "limit": r["limit"],
+                     "status": f"{b['status']}->{r['status']}", "wall_old": b["wall"], "wall_new": r["wall"],
+                     "speedup": b["wall"] / r["wall"] if r["wall"] else None,
+                     "nusmv_old": b["nusmv_calls"], "nusmv_new": r["nusmv_calls"], "same_strategies": b["strategies"] == r["strategies"]})
+    return rows
+
+
+# --- Command line --------------------------------------------------------------------
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the control-strategy engines.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="run a suite and append the results (JSON lines) to --out")
+    run.add_argument("--suite", choices=["emt", "random", "all"], default="emt")
+    run.add_argument("--phenotypes", nargs="*", choices=PHENOTYPES, help="subset of the EMT targets")
+    run.add_argument("--sizes", nargs="*", type=int, default=[10, 20, 40, 80], help="random network sizes")
+    run.add_argument("--k", type=int, default=2, help="regulators per node of the random networks")
+    run.add_argument("--seeds", nargs="*", type=int, default=[0, 1, 2], help="random network seeds")
+    run.add_argument("--engines", nargs="*", choices=ENGINES, default=ENGINES)
+    run.add_argument("--limits", nargs="*", type=int, default=[1, 2])
+    run.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="workers of the parallel and chunked engines")
+    run.add_argument("--timeout", type=float, default=None, help="seconds per run")
+    run.add_argument("--profile", action="store_true", help="record the stage timings of every run")
+    run.add_argument("--model-checker", choices=["nusmv", "bdd"], default="nusmv", help="backend of the EF(AG(target)) queries")
+    run.add_argument("--out", default="benchmarks.jsonl")
+    cmp = sub.add_parser("compare", help="compare two result files")
+    cmp.add_argument("old")
+    cmp.add_argument("new")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.command == "compare":
+        for r in compare(args.old, args.new):
+            speedup = f"{r['speedup']:.2f}x" if r["speedup"] else "-"
+            print(f"{r['network']:24} {r['target_name']:8} {r['engine']:15} {r['limit']:2} {r['status']:12} "
+                  f"{r['wall_old']:9.2f}s {r['wall_new']:9.2f}s {speedup:>8} NuSMV {r['nusmv_old']}->{r['nusmv_new']}"
+                  f"{'' if r['same_strategies'] else '  STRATEGIES DIFFER'}")
+        return
+
+    cases = []
+    if args.suite in ("emt", "all"):
+        cases.append(c for c in emt_suite() if not args.phenotypes or c["target_name"] in args.phenotypes)
+    if args.suite in ("random", "all"):
+        cases.append(random_suite(args.sizes, args.k, args.seeds))
+    for suite in cases:
+        run_benchmarks(suite, args.engines, args.limits, args.out, args.jobs, args.timeout, args.profile, args.model_checker)
+
+
+if __name__ == "__main__":
+    main()
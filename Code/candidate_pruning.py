@@ -0,0 +1,181 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from pyboolnet.prime_implicants import find_inputs
+
+log = logging.getLogger(__name__)
+
+RULES = ("reachability", "signs")
+
+# --- Signed interaction graph ---------------------------------------------------
+
+def signed_interaction_graph(primes: dict) -> Dict[str, Dict[str, set]]:
+    """
+    Returns the signed interaction graph of *primes* as {source: {target: signs}}: sign 1 if the source occurs
+    positively in a prime implicant of the target (with value 1 in a prime of f, with value 0 in a prime of !f), -1 if it occurs negatively.
+
+    **example**::
+        >>> signed_interaction_graph({"v1": [[{"v2": 0}], [{"v2": 1}]], "v2": [[{"v2": 1}], [{"v2": 0}]]})
+        {'v1': {}, 'v2': {'v1': {1}, 'v2': {-1}}}
+    """
+
+    graph = {v: {} for v in primes}
+    for v in primes:
+        for k in (0, 1):
+            for p in primes[v][k]:
+                for u, x in p.items():
+                    graph[u].setdefault(v, set()).add(1 if x == k else -1)
+    return graph
+
+
+def target_influence(primes: dict, target: List[dict], blocked: Iterable[str] = ()) -> Dict[str, set]:
+    """
+    Returns, for every variable with a walk to a target variable in the signed interaction graph, the values of it that
+    push some target variable towards its value in some subspace of *target*: along a walk of sign 1 the value is passed on,
+    along a walk of sign -1 it is negated. Walks do not pass through the *blocked* variables (e.g. the ones fixed in every candidate).
+    A walk through a negative cycle has both signs, so both values count for the variables upstream of such a cycle.
+
+    **arguments**:
+        * *primes*: prime implicants.
+        * *target*: list of subspaces.
+        * *blocked*: variables that are fixed anyway. Default value: none.
+    **returns**:
+        * *influence* (dict): variable -> set of helping values; variables without a walk to the target are missing.
+    """
+
+    blocked = set(blocked)
+    regulators = {v: [] for v in primes}
+    for u, out in signed_interaction_graph(primes).items():
+        if u in blocked: continue
+        for v, signs in out.items():
+            regulators[v].append((u, signs))
+
+    influence, todo = {}, []
+    for t in target:
+        for v, x in t.items():
+            if v not in blocked and x not in influence.setdefault(v, set()):
+                influence[v].add(x); todo.append((v, x))
+    while todo:
+        v, x = todo.pop()
+        for u, signs in regulators[v]:
+            for y in {x if s == 1 else 1 - x for s in signs}:
+                if y not in influence.setdefault(u, set()):
+                    influence[u].add(y); todo.append((u, y))
+    return {v: values for v, values in influence.items() if values}
+
+# --- Pruning ---------------------------------------------------------------------
+
+def count_candidates(counts: List[int], size: int) -> int:
+    """
+    Returns the number of candidates of *size* variables when variable i can take *counts[i]* values,
+    i.e. the elementary symmetric polynomial of degree *size* of *counts*.
+    """
+
+    e = [1] + [0] * size
+    for c in counts:
+        for k in range(size, 0, -1):
+            e[k] += c * e[k - 1]
+    return e[size]
+
+
+def count_enumerated(candidates: list, counts: Dict, size: int) -> int:
+    """
+    Returns the number of candidates of *size* that the node and edge enumeration yields from *candidates* when candidate c
+    takes *counts[c]* values (none if missing), i.e. without the combinations of a node and an edge into that node.
+    """
+
+    groups = {}
+    for c in candidates:
+        if counts.get(c): groups.setdefault(c[1] if isinstance(c, tuple) else c, []).append(c)
+    e = [1] + [0] * size
+    for v, group in groups.items():
+        # A node and the edges into it: either the node alone or any of the edges
+        poly = [count_candidates([counts[c] for c in group if isinstance(c, tuple)], k) for k in range(size + 1)]
+        if v in group and size: poly[1] += counts[v]
+        e = [sum(e[i] * poly[k - i] for i in range(k + 1)) for k in range(size + 1)]
+    return e[size]
+
+
+class PruningReport:
+    """
+    What :func:`prune_candidates` removed: the variables without a walk to the target, the dominated (variable, value) pairs,
+    the redundant input edges and the number of candidates of each size before and after.
+    """
+
+    def __init__(self, rule: str, unreachable: list, dominated: list, input_edges: list, before: Dict[int, int], after: Dict[int, int]):
+        self.rule, self.unreachable, self.dominated, self.input_edges = rule, unreachable, dominated, input_edges
+        self.before, self.after = before, after
+
+    def __str__(self):
+        rule = f"{self.rule}, lossy heuristic" if self.rule == "signs" else self.rule
+        lines = [f"Pruning ({rule}): {len(self.unreachable)} variables without a path to the target, "
+                 f"{len(self.dominated)} dominated values, {len(self.input_edges)} edges equivalent to an input node"]
+        if self.unreachable: lines.append(f"  no path: {', '.join(map(str, self.unreachable))}")
+        if self.dominated: lines.append(f"  dominated: {', '.join(f'{v}={x}' for v, x in self.dominated)}")
+        if self.input_edges: lines.append(f"  input edges: {', '.join(f'{u}->{v}' for u, v in self.input_edges)}")
+        for size in self.before:
+            b, a = self.before[size], self.after[size]
+            lines.append(f"  size {size}: {a} of {b} candidates left ({100 * (1 - a / b) if b else 0:.1f}% cut)")
+        return "\n".join(lines)
+
+
+def prune_candidates(primes: dict, target: List[dict], candidates: list, common: dict = None, rule: str = "reachability", sizes: Iterable[int] = ()) -> Tuple[Dict, PruningReport]:
+    """
+    Static pre-analysis of the candidate interventions of an enumeration over the signed interaction graph (see :func:`target_influence`),
+    with the *common* variables, which every candidate fixes, blocked.
+
+        * "reachability" removes the variables without a walk to a target variable. Fixing such a variable does not change
+          the dynamics of the variables the target depends on, so a strategy containing it is never minimal: this rule is exact.
+        * "signs" is a lossy heuristic: it also removes the value of a variable if every walk from it to the target pushes the
+          target variables away from the target (e.g. only positive walks to variables that must be 0). This assumes that such
+          a value never helps, which holds when the influence of the variable is monotone; strategies that rely on
+          non-monotone effects may be missed.
+
+    Edge interventions (source, target) in *candidates* are handled like their target variable, with the sign of the edge.
+    With node and edge candidates, the edges of an input node whose only successor is the edge target are removed,
+    since the input node is an equivalent node intervention of size 1.
+
+    **arguments**:
+        * *primes*: prime implicants.
+        * *target*: list of subspaces.
+        * *candidates*: candidate variables and edges, in enumeration order.
+        * *common*: variables fixed in every candidate. Default value: none.
+        * *rule*: "reachability" or "signs" (lossy). Default value: "reachability".
+        * *sizes*: candidate sizes to count in the report. Default value: none.
+    **returns**:
+        * *values* (dict): candidate -> tuple of values left, in the order of *candidates*.
+        * *report* (:class:`PruningReport`): what was removed.
+    **example**::
+        >>> values, report = prune_candidates(primes, target, cand_vars, common, "reachability", range(1, 4))
+        >>> print(report)
+    """
+
+    if rule not in RULES: raise ValueError(f"Unknown pruning rule {rule}, expected one of {RULES}.")
+    common = common or {}
+    influence = target_influence(primes, target, blocked=common)
+    graph = signed_interaction_graph(primes)
+
+    def helping(c):
+        if not isinstance(c, tuple): return influence.get(c, set())
+        u, v = c
+        return {x if s == 1 else 1 - x for x in influence.get(v, ()) for s in graph[u].get(v, ())}
+
+    input_edges = []
+    nodes = {c for c in candidates if not isinstance(c, tuple)}
+    for u in find_inputs(primes):
+        successors = [v for v in graph[u] if v != u]
+        if u in nodes and len(successors) == 1 and (u, successors[0]) in candidates:
+            input_edges.append((u, successors[0]))
+
+    values, unreachable, dominated = {}, [], []
+    for c in candidates:
+        if c in input_edges: continue
+        helps = helping(c)
+        if not helps: unreachable.append(c); continue
+        if rule == "reachability": helps = {0, 1}
+        dominated.extend((c, x) for x in (0, 1) if x not in helps)
+        values[c] = tuple(x for x in (0, 1) if x in helps)
+
+    # Both counts over the combinations the enumeration yields, see count_enumerated
+    before = {size: count_enumerated(candidates, dict.fromkeys(candidates, 2), size) for size in sizes}
+    after = {size: count_enumerated(candidates, {c: len(x) for c, x in values.items()}, size) for size in sizes}
+    return values, PruningReport(rule, unreachable, dominated, input_edges, before, after)
@@ -0,0 +1,57 @@
+import logging, os, pickle, time
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+class Checkpoint:
+    """
+    Periodic, atomic snapshot of a control-strategy enumeration.
+    Candidates are numbered by their position in the enumeration stream. The
+    checkpoint keeps the frontier (every candidate before *position* is resolved,
+    plus the resolved ones in *done* beyond it) and the strategies found so far;
+    the percolation cache persists through its own path. *signature* identifies the search; a
+    checkpoint written for a different search is rejected. With *path* None
+    nothing is written, so enumerators can use one code path either way.
+    """
+
+    def __init__(self, path: Optional[str], signature, interval: float = 60.0):
+        self.path, self.signature, self.interval = path, signature, interval
+        self.position, self.done, self.strategies = 0, set(), []
+        self._last = time.monotonic()
+        if path and os.path.exists(path): self.load()
+
+    def load(self):
+        with open(self.path, "rb") as f: data = pickle.load(f)
+        if data["signature"] != self.signature:
+            raise ValueError(f"Checkpoint {self.path} belongs to a different search.")
+        self.position, self.done = data["position"], data["done"]
+        self.strategies = data["strategies"]
+        log.info(f"Resuming from {self.path}: position {self.position}, {len(self.strategies)} strategies")
+
+    def restore(self, strategies: List[dict]) -> List[dict]:
+        """Return *strategies* extended by the checkpointed ones."""
+        return strategies + [s for s in self.strategies if s not in strategies]
+
+    def stream(self, candidates: Iterable[dict]) -> Iterator[Tuple[int, dict]]:
+        """Yield (index, candidate) for the candidates not resolved yet."""
+        for idx, cand in enumerate(islice(candidates, self.position, None), self.position):
+            if idx not in self.done: yield idx, cand
+
+    def resolve(self, idx: int):
+        """Mark the candidate at *idx* as resolved and advance the frontier."""
+        self.done.add(idx)
+        while self.position in self.done:
+            self.done.discard(self.position); self.position += 1
+
+    def tick(self, strategies: List[dict]):
+        """Save if *interval* seconds have passed since the last save."""
+        if time.monotonic() - self._last >= self.interval: self.save(strategies)
+
+    def save(self, strategies: List[dict]):
+        if not self.path: return
+        data = {"signature": self.signature, "position": self.position, "done": self.done, "strategies": strategies}
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f: pickle.dump(data, f)
+        os.replace(tmp, self.path)
+        self._last = time.monotonic()
@@ -0,0 +1,131 @@
+import hashlib, json, logging, os, pickle
+from collections import OrderedDict
+from typing import List, Optional
+from percolation_engine import engine_for
+
+log = logging.getLogger(__name__)
+
+# --- Canonical keys -----------------------------------------------------------
+
+def freeze(sub: dict) -> tuple:
+    """Return a canonical, hashable form of a subspace."""
+    return tuple(sorted(sub.items(), key=repr))
+
+def freeze_target(target) -> tuple:
+    """Return a canonical, hashable form of a target (one subspace or a list of them)."""
+    return freeze(target) if isinstance(target, dict) else tuple(sorted(freeze(t) for t in target))
+
+def network_hash(primes: dict) -> str:
+    """Return a stable content hash of a prime-implicant dict."""
+    canon = sorted((v, [sorted(freeze(p) for p in primes[v][k]) for k in (0, 1)]) for v in primes)
+    return hashlib.sha1(json.dumps(canon).encode()).hexdigest()
+
+# --- Percolation cache --------------------------------------------------------
+
+class PercolationCache:
+    """
+    Percolation results and control verdicts for one network.
+    Percolations are keyed on the frozen candidate, verdicts on
+    (frozen percolation, target, update, method). If *path* is given the cache
+    is loaded from and saved to that file, so runs over several targets share it.
+    """
+
+    def __init__(self, primes: dict, path: Optional[str] = None):
+        self.primes, self.path = primes, path
+        self.network = network_hash(primes)
+        self.percolations, self.verdicts = {}, {}
+        if path and os.path.exists(path): self.load()
+
+    def percolate(self, cand: dict) -> dict:
+        """Return the constants of *primes* after percolating *cand*."""
+        key = freeze(cand)
+        if key not in self.percolations:
+            self.percolations[key] = freeze(engine_for(self.primes).percolate(cand))
+        return dict(self.percolations[key])
+
+    def prefetch(self, cands: List[dict]):
+        """Percolate the candidates that are not cached yet in one batch (see PercolationEngine.percolate_batch)."""
+        todo = {}
+        for cand in cands:
+            key = freeze(cand)
+            if key not in self.percolations: todo[key] = cand
+        if not todo: return
+        engine = engine_for(self.primes)
+        matrix = engine.percolate_batch(list(todo.values()))
+        # Build the frozen percolations straight from the rows: columns in freeze order, one shared (name, value) pair per item
+        order = sorted(range(len(engine.names)), key=lambda j: repr((engine.names[j], 0)))
+        items = [((engine.names[j], 0), (engine.names[j], 1)) for j in order]
+        for key, row in zip(todo, matrix[:, order].tolist()):
+            self.percolations[key] = tuple(item[v] for item, v in zip(items, row) if v >= 0)
+
+    def verdict(self, perc: dict, target, update: str, method: str) -> Optional[bool]:
+        """Return the stored verdict for *perc*, or None if it was never decided."""
+        return self.verdicts.get((freeze(perc), freeze_target(target), update, method))
+
+    def set_verdict(self, perc: dict, target, update: str, method: str, value: bool):
+        self.verdicts[(freeze(perc), freeze_target(target), update, method)] = bool(value)
+
+    def load(self):
+        with open(self.path, "rb") as f: data = pickle.load(f)
+        if data.get("network") != self.network:
+            return log.warning(f"Ignoring cache {self.path}: built for a different network.")
+        self.percolations.update(data["percolations"]); self.verdicts.update(data["verdicts"])
+        log.info(f"Loaded {len(self.percolations)} percolations, {len(self.verdicts)} verdicts from {self.path}")
+
+    def save(self):
+        """Write the cache to *path* atomically (no-op for in-memory caches)."""
+        if not self.path: return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump({"network": self.network, "percolations": self.percolations, "verdicts": self.verdicts}, f)
+        os.replace(tmp, self.path)
+
+# --- Model-checking verdict cache -------------------------------------------------
+
+class QueryCache:
+    """
+    Content-addressed model-checking verdicts, keyed by a hash of
+    (primes, CTL specification, update). Identical sub-queries, e.g. different
+    candidates that reduce to the same residual network, are answered once.
+    Verdicts live in an in-memory LRU of *maxsize* entries and, if *path* is
+    given, as one small file per verdict below that directory; writes are
+    atomic, so concurrent workers and later runs can share the directory.
+    """
+
+    def __init__(self, maxsize: int = 100_000, path: Optional[str] = None):
+        self.maxsize, self.path = maxsize, path
+        self.memory = OrderedDict()
+        self.hits = self.misses = 0
+        if path: os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(primes: dict, spec: str, update: str) -> str:
+        return hashlib.sha1(f"{network_hash(primes)}|{update}|{spec}".encode()).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key: str) -> Optional[bool]:
+        """Return the cached verdict for *key*, or None."""
+        if key in self.memory:
+            self.memory.move_to_end(key); self.hits += 1
+            return self.memory[key]
+        if self.path and os.path.exists(self._file(key)):
+            with open(self._file(key)) as f: value = f.read() == "1"
+            self._remember(key, value); self.hits += 1
+            return value
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: bool):
+        self._remember(key, bool(value))
+        if not self.path: return
+        os.makedirs(os.path.dirname(self._file(key)), exist_ok=True)
+        tmp = f"{self._file(key)}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f: f.write("1" if value else "0")
+        os.replace(tmp, self._file(key))
+
+    def _remember(self, key: str, value: bool):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.maxsize: self.memory.popitem(last=False)
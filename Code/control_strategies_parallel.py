@@ -1,86 +1,218 @@
-import logging, math, os, tempfile, shutil, tqdm
-from itertools import combinations, product
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from typing import List, Optional
-from pyboolnet.prime_implicants import find_inputs, find_constants, percolate, remove_variables
-from pyboolnet.trap_spaces import compute_trap_spaces
+import logging, math, os, select, signal, tempfile, threading, shutil, time, tqdm
+from multiprocessing.util import Finalize
+from collections import deque
+from functools import partial
+from itertools import chain, combinations, product, islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from typing import Dict, List, Optional
+from pyboolnet.prime_implicants import find_inputs, find_constants
 from pyboolnet.attractors import completeness
 from pyboolnet.model_checking import model_checking
 from pyboolnet.temporal_logic import subspace2proposition
 from pyboolnet.helpers import dicts_are_consistent
+from candidate_pruning import count_candidates, prune_candidates
+from control_cache import PercolationCache, QueryCache, freeze, freeze_target, network_hash
+from checkpoint import Checkpoint
+from percolation_engine import engine_for
+from subspaces import SubspaceIndex, is_included_in_subspace
+from symbolic_model_checking import UPDATES as BDD_UPDATES, efag_holds
+from control_strategies_trap_spaces import iter_trap_spaces
+from instrumentation import disable, drain, enable, merge, settings, stage, stage_iter, tally
+from work_queue import ClusterExecutor
 
 log = logging.getLogger(__name__)
 
 # --- Core helpers ------------------------------------------------------------
 
-def is_included_in_subspace(a: dict, b: dict) -> bool:
-    """Return True if subspace a contains b."""
-    return all(x in a and a[x] == b[x] for x in b)
-
 def EFAG_set_of_subspaces(primes: dict, subs: List[dict]) -> str:
     """Return CTL EF(AG(...)) formula for union of subspaces."""
     return f"EF(AG({' | '.join(subspace2proposition(primes, s) for s in subs)}))"
 
 def fix_components_and_reduce(primes: dict, sub: dict, keep: List[str] = []) -> dict:
     """Fix vars in sub, percolate, and remove constants not in keep."""
-    p = percolate(primes, add_constants=sub, copy=True)
-    rem = [k for k in find_constants(p) if k not in keep]
-    return remove_variables(p, rem, copy=True)
+    with stage("reduce"):
+        return engine_for(primes).reduce(sub, keep)
 
 # --- Control strategy tests ---------------------------------------------------
 
 def select_control_strategies_by_percolation(primes, strategies, target):
     """Select strategies that percolate into target."""
-    out = []
-    for s in strategies:
-        perc = find_constants(percolate(primes, add_constants=s, copy=True))
-        if any(is_included_in_subspace(perc, t) for t in target): out.append(s)
-    return out
-
-def control_direct_percolation(primes, cand, target):
-    """Check if cand percolates directly into target."""
-    perc = find_constants(percolate(primes, add_constants=cand, copy=True))
+    engine = engine_for(primes)
+    hits = engine.contained(engine.percolate_batch(strategies), target)
+    return [s for s, hit in zip(strategies, hits) if hit]
+
+def control_direct_percolation(primes, cand, target, perc=None):
+    """Check if cand percolates directly into target (*perc*: its percolation, if already known)."""
+    perc = _percolate(primes, cand) if perc is None else perc
     if any(is_included_in_subspace(perc, t) for t in target):
         log.info(f"Intervention (only percolation): {cand}")
         return True
     return False
 
+def _percolate(primes, cand):
+    with stage("percolation"):
+        return engine_for(primes).percolate(cand)
+
+_query_cache = QueryCache()
+
+def set_query_cache(cache: Optional[QueryCache]):
+    """Replace the model-checking verdict cache used by run_control_query (None disables it)."""
+    global _query_cache
+    _query_cache = cache
+
 def run_control_query(primes, target, update):
-    """Run CTL model-checking query for target."""
-    return model_checking(primes, update, "INIT TRUE", "CTLSPEC " + EFAG_set_of_subspaces(primes, target))
+    """Run CTL model-checking query for target; verdicts are memoized on the (reduced) network."""
+    spec = "CTLSPEC " + EFAG_set_of_subspaces(primes, target)
+    if _query_cache is None: return _model_checking(primes, update, target, spec, "model_checking.target")
+    key = _query_cache.key(primes, spec, update)
+    verdict = _query_cache.get(key)
+    tally("query_cache.miss" if verdict is None else "query_cache.hit")
+    if verdict is None:
+        verdict = _model_checking(primes, update, target, spec, "model_checking.target")
+        _query_cache.put(key, verdict)
+    return verdict
+
+_model_checker = "nusmv"
+
+def set_model_checker(name: str):
+    """
+    Select the backend of the EF(AG(target)) queries: "nusmv" (one NuSMV process per query) or "bdd"
+    (symbolic_model_checking, in process; queries with an update other than asynchronous or synchronous still go to NuSMV).
+    """
+    global _model_checker
+    if name not in ("nusmv", "bdd"): raise ValueError(f"Unknown model checker {name}, expected 'nusmv' or 'bdd'.")
+    _model_checker = name
+
+def get_model_checker() -> str:
+    """The backend selected by set_model_checker, e.g. to pass it on to workers that do not inherit it."""
+    return _model_checker
+
+def _model_checking(primes, update, target, spec, name):
+    """Decide the query *spec* (EF(AG(target)) from all states) with the selected backend."""
+    with stage(name):
+        if _model_checker == "bdd" and update in BDD_UPDATES: return efag_holds(primes, update, target)
+        return model_checking(primes, update, "INIT TRUE", spec)
 
 def reduce_and_run_control_query(primes, sub, target, update):
     """Reduce by subspace, then run control query."""
     keep = list({k for s in target for k in s})
     return run_control_query(fix_components_and_reduce(primes, sub, keep), target, update)
 
+_trap_space_threads = min(4, os.cpu_count() or 1)
+
+def set_trap_space_threads(n: int):
+    """Set how many trap-space queries control_is_valid_in_trap_spaces runs at once (1: one after the other)."""
+    global _trap_space_threads
+    _trap_space_threads = max(1, n)
+
 def control_is_valid_in_trap_spaces(primes, traps, target, update):
-    """Check that trap spaces are compatible with target."""
-    if not all(any(dicts_are_consistent(ts, t) for t in target) for ts in traps): return False
-    for ts in [x for x in traps if not any(is_included_in_subspace(x, t) for t in target)]:
-        if not reduce_and_run_control_query(primes, ts, target, update): return False
+    """
+    Check that trap spaces are compatible with target. *traps* is read once and may be a generator
+    (see iter_trap_spaces); a trap space disjoint from the target stops it at once. The queries of the trap spaces
+    outside the target run cheapest first (smallest cone of influence of the target in the reduced network),
+    several at once; the first failing one cancels the others.
+    """
+    keep = list({k for s in target for k in s})
+    queries = {}  # query cache key -> (reduced primes, spec); trap spaces with the same reduction are checked once
+    outside = []
+    for ts in stage_iter("trap_spaces", traps):
+        if not any(dicts_are_consistent(ts, t) for t in target): return False
+        if not any(is_included_in_subspace(ts, t) for t in target): outside.append(ts)
+    for ts in outside:
+        new = fix_components_and_reduce(primes, ts, keep)
+        spec = "CTLSPEC " + EFAG_set_of_subspaces(new, target)
+        key = QueryCache.key(new, spec, update)
+        verdict = _query_cache.get(key) if _query_cache is not None and key not in queries else None
+        if _query_cache is not None and key not in queries: tally("query_cache.miss" if verdict is None else "query_cache.hit")
+        if verdict is False: return False
+        if verdict is None: queries.setdefault(key, (new, spec))
+    cost = {key: len(_cone_of_influence(new, keep)) for key, (new, _) in queries.items()}  # NuSMV runs with -coi
+    return _run_trap_space_queries(sorted(queries.items(), key=lambda q: cost[q[0]]), target, update)
+
+def _cone_of_influence(primes, roots):
+    """Return the variables of *primes* that *roots* depend on, *roots* included."""
+    seen, todo = set(roots), list(roots)
+    while todo:
+        for p in chain.from_iterable(primes[todo.pop()]):
+            todo.extend(u for u in p if u not in seen); seen.update(p)
+    return seen
+
+def _run_trap_space_queries(queries, target, update):
+    """
+    Run the (key, (primes, spec)) *queries*, in order and _trap_space_threads at a time; False at the first false one.
+    The BDD backend runs them one after the other, since it holds the GIL.
+    """
+    def record(key, verdict):
+        if _query_cache is not None: _query_cache.put(key, verdict)
+        return verdict
+    if _trap_space_threads == 1 or len(queries) <= 1 or (_model_checker == "bdd" and update in BDD_UPDATES):
+        return all(record(key, _model_checking(new, update, target, spec, "model_checking.trap_space")) for key, (new, spec) in queries)
+    stop = threading.Event()
+    with ThreadPoolExecutor(_trap_space_threads) as exe:
+        futures = {exe.submit(_model_checking_until, new, update, spec, stop): key for key, (new, spec) in queries}
+        try:
+            for fut in as_completed(futures):
+                if not record(futures[fut], fut.result()): return False
+        finally:
+            stop.set()
+            for fut in futures: fut.cancel()
     return True
 
-def control_completeness(primes, cand, target, update):
+def _model_checking_until(primes, update, spec, stop: threading.Event) -> Optional[bool]:
+    """model_checking(primes, update, "INIT TRUE", spec), or None if *stop* is set before it finishes."""
+    if stop.is_set(): return None
+    with stage("model_checking.trap_space"):
+        return _run_model_checking_until(primes, update, spec, stop)
+
+def _run_model_checking_until(primes, update, spec, stop):
+    """
+    Run pyboolnet's model_checking in a forked child that leads its own process group, so that killing the group once
+    *stop* is set also kills the NuSMV process it started. The verdict comes back through a pipe.
+    """
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read); os.setpgrp()
+            os.write(write, b"1" if model_checking(primes, update, "INIT TRUE", spec) else b"0")
+        except BaseException as e:
+            os.write(write, f"E{type(e).__name__}: {e}".encode())
+        finally:
+            os._exit(0)
+    os.close(write)
+    try:
+        while not select.select([read], [], [], 0.05)[0]:
+            if stop.is_set():
+                try: os.killpg(pid, signal.SIGKILL)
+                except ProcessLookupError: os.kill(pid, signal.SIGKILL)  # the child has not made its group yet
+                tally("model_checking.cancelled")
+                return None
+        output = b"".join(iter(lambda: os.read(read, 4096), b""))
+    finally:
+        os.close(read); os.waitpid(pid, 0)
+    if output in (b"0", b"1"): return output == b"1"
+    raise RuntimeError(f"Model checking failed: {output[1:].decode() or 'no answer'}")
+
+def control_completeness(primes, cand, target, update, perc=None):
     """Completeness-based control check."""
     if not isinstance(target, dict): return log.error("Target must be dict.")
-    perc = find_constants(percolate(primes, add_constants=cand, copy=True))
+    perc = _percolate(primes, cand) if perc is None else perc
     new = fix_components_and_reduce(primes, perc, list(target))
-    traps = compute_trap_spaces(new, "min")
-    if not all(is_included_in_subspace(t, target) for t in traps): return False
-    if completeness(new, update):
+    if not all(is_included_in_subspace(t, target) for t in stage_iter("trap_spaces", iter_trap_spaces(new, "min", max_output=10_000))): return False
+    with stage("completeness"):
+        complete = completeness(new, update)
+    if complete:
         log.info(f"Intervention (by completeness): {cand}")
         return True
     return False
 
-def control_model_checking(primes, cand, target, update, max_traps=10_000_000):
+def control_model_checking(primes, cand, target, update, max_traps=10_000_000, perc=None):
     """Model-checking-based control check."""
     if not isinstance(target, list): return log.error("Target must be list.")
-    perc = find_constants(percolate(primes, add_constants=cand, copy=True))
+    perc = _percolate(primes, cand) if perc is None else perc
     keep = list({k for s in target for k in s})
     new = fix_components_and_reduce(primes, perc, keep)
-    traps = compute_trap_spaces(new, "min", max_output=max_traps)
-    if not control_is_valid_in_trap_spaces(new, traps, target, update): return False
+    if not control_is_valid_in_trap_spaces(new, iter_trap_spaces(new, "min", max_output=max_traps), target, update): return False
     if run_control_query(new, target, update):
         log.info(f"Intervention (by CTL formula): {cand}")
         return True
@@ -109,114 +241,552 @@ def is_control_strategy(primes, cand, target, update, max_output=1_000_000):
     if control_direct_percolation(primes, cand, target): return True
     keep = list({k for s in target for k in s})
     new = fix_components_and_reduce(primes, cand, keep)
-    traps = compute_trap_spaces(new, "min", max_output=max_output)
-    if not control_is_valid_in_trap_spaces(new, traps, target, update): return False
+    if not control_is_valid_in_trap_spaces(new, iter_trap_spaces(new, "min", max_output=max_output), target, update): return False
     return run_control_query(new, target, update)
 
+# --- Candidate stream ----------------------------------------------------------
+
+def iter_candidates(cand_vars, size, common, values=None):
+    """Yield candidates of *size* free vars (plus common vars) in enumeration order (*values*: the values to try per var, default 0 and 1)."""
+    for vs in combinations(cand_vars, size):
+        for ss in product(*([values[v] for v in vs] if values else [(0, 1)] * size)):
+            yield {**dict(zip(vs, ss)), **common}
+
+class CandidateRanks:
+    """
+    Random access to the candidates of iter_candidates(cand_vars, size, common, values) by their position (rank) in it,
+    without materializing them. The suffix counts W[j][k] of the k-combinations of cand_vars[j:], each weighted by its
+    number of value assignments, locate the variable combination of a rank; the rest of the rank is a mixed-radix
+    index into the product of its values.
+
+    **example**::
+        >>> ranks = CandidateRanks(["v1", "v2", "v3"], 2, {})
+        >>> ranks.total, ranks.unrank(5), list(ranks.iter_range(3, 5))
+        (12, {'v1': 0, 'v3': 1}, [{'v1': 1, 'v2': 1}, {'v1': 0, 'v3': 0}])
+    """
+
+    def __init__(self, cand_vars, size, common, values=None):
+        self.cand_vars, self.size, self.common = list(cand_vars), size, common
+        self.radix = [tuple(values[v]) if values else (0, 1) for v in self.cand_vars]
+        n = len(self.cand_vars)
+        self.W = [[1] + [0] * size for _ in range(n + 1)]
+        for j in range(n - 1, -1, -1):
+            for k in range(1, size + 1): self.W[j][k] = self.W[j + 1][k] + len(self.radix[j]) * self.W[j + 1][k - 1]
+        self.total = self.W[0][size]
+
+    def _locate(self, rank, start, k):
+        """Return (indices, offset): the k-combination of cand_vars[start:] holding *rank*, and the rank of its first candidate."""
+        if k == 0: return [], 0
+        skipped = 0
+        for j in range(start, len(self.cand_vars) - k + 1):
+            c = len(self.radix[j])
+            block = c * self.W[j + 1][k - 1]  # the combinations starting with j; within it, c candidates per rank of the rest
+            if rank < block:
+                rest, offset = self._locate(rank // c, j + 1, k - 1)
+                return [j] + rest, skipped + c * offset
+            rank -= block; skipped += block
+        raise IndexError(f"rank beyond the {self.total} candidates")
+
+    def unrank(self, rank):
+        """The candidate at *rank*."""
+        idx, offset = self._locate(rank, 0, self.size)
+        rank -= offset
+        values = []
+        for j in reversed(idx):
+            rank, x = divmod(rank, len(self.radix[j]))
+            values.append(self.radix[j][x])
+        return {**dict(zip((self.cand_vars[j] for j in idx), reversed(values))), **self.common}
+
+    def rank(self, cand):
+        """The rank of *cand* (inverse of unrank); ValueError if it is not a candidate of this size."""
+        index = {v: j for j, v in enumerate(self.cand_vars)}
+        free = [v for v in cand if v not in self.common]
+        if len(free) != self.size or any(v not in index or cand[v] not in self.radix[index[v]] for v in free) \
+                or any(cand.get(v) != x for v, x in self.common.items()):
+            raise ValueError(f"{cand} is not a candidate of size {self.size}")
+        idx = sorted(index[v] for v in free)
+        offset, scale, start, value = 0, 1, 0, 0
+        for i, j in enumerate(idx):
+            k = self.size - i
+            offset += scale * sum(len(self.radix[t]) * self.W[t + 1][k - 1] for t in range(start, j))
+            scale *= len(self.radix[j]); start = j + 1
+            value = value * len(self.radix[j]) + self.radix[j].index(cand[self.cand_vars[j]])
+        return offset + value
+
+    def iter_range(self, first, last):
+        """Yield the candidates of rank *first* to *last* - 1, in order."""
+        last = min(last, self.total)
+        if first >= last: return
+        idx, offset = self._locate(first, 0, self.size)
+        skip, left, n = first - offset, last - first, len(self.cand_vars)
+        while True:
+            vs = [self.cand_vars[j] for j in idx]
+            for ss in islice(product(*(self.radix[j] for j in idx)), skip, None):
+                yield {**dict(zip(vs, ss)), **self.common}
+                left -= 1
+                if not left: return
+            skip = 0
+            i = next(i for i in reversed(range(self.size)) if idx[i] < n - self.size + i)  # next combination
+            idx[i:] = range(idx[i] + 1, idx[i] + 1 + self.size - i)
+
+def _candidate_values(primes, target, cand_vars, common, sizes, prune):
+    """Return (cand_vars, values) after the *prune* rule of candidate_pruning (none if *prune* is None), logging what was cut."""
+    if not prune: return cand_vars, None
+    values, report = prune_candidates(primes, target, cand_vars, common, prune, sizes)
+    log.info(str(report))
+    return list(values), values
+
+def prefetch_percolations(stream, cache, chunk=4096):
+    """Pass (index, candidate) pairs through, percolating them into *cache* in batches of *chunk* ahead of use."""
+    stream = iter(stream)
+    while True:
+        block = list(islice(stream, chunk))
+        if not block: return
+        with stage("percolation.batch"):
+            cache.prefetch([cand for _, cand in block])
+        yield from block
+
+def _open_search(primes, target, update, method, cand_vars, sizes, common, checkpoint, cache, known, values=None):
+    """Return (checkpoint, strategies, stream of (index, candidate)) for an enumeration, resuming if possible."""
+    ckpt = Checkpoint(checkpoint, (network_hash(primes), freeze_target(target), update, method,
+                                   tuple(cand_vars), tuple(sizes), freeze(common)) + ((tuple(values.items()),) if values else ()))
+    for k in known: cache.set_verdict(cache.percolate(k), target, update, method, True)
+    strategies = ckpt.restore(known[:])
+    stream = prefetch_percolations(ckpt.stream(chain.from_iterable(iter_candidates(cand_vars, i, common, values) for i in sizes)), cache)
+    total = sum(count_candidates([len(values[v]) for v in cand_vars], i) if values else math.comb(len(cand_vars), i) * 2 ** i for i in sizes)
+    return ckpt, strategies, tqdm.tqdm(stream, total=total, initial=ckpt.position)
+
 # --- Completeness-based computation -------------------------------------------
 
 def compute_control_strategies_with_completeness(primes, target, update="asynchronous", limit=3,
-                                                 avoid=None, start=0, known=None):
-    """Enumerate completeness-based control strategies."""
+                                                 avoid=None, start=0, known=None, cache=None, checkpoint=None, prune=None):
+    """
+    Enumerate completeness-based control strategies (*cache*: a PercolationCache to share/persist;
+    *checkpoint*: file to save progress to periodically and resume from; *prune*: "reachability" or "signs" (lossy)
+    to drop candidates by static analysis first, see candidate_pruning.prune_candidates).
+    """
     if isinstance(target, list): return log.error("Target must be dict.")
     avoid, known = avoid or [], known or []
+    cache = cache or PercolationCache(primes)
     common = find_common_variables_in_control_strategies(primes, [target])
     cand_vars = [v for v in primes if v not in common and v not in avoid]
     log.info(f"Common vars: {len(common)} | Candidates: {len(cand_vars)}")
-    strategies, perc_true, perc_false = known[:], known[:], []
-    for i in range(max(0, start - len(common)), limit + 1 - len(common)):
-        for vs in combinations(cand_vars, i):
-            for ss in product(*[(0, 1)] * i):
-                cand = dict(zip(vs, ss)); cand.update(common)
-                if any(is_included_in_subspace(cand, x) for x in strategies): continue
-                perc = find_constants(percolate(primes, add_constants=cand, copy=True))
-                if perc in perc_true:
-                    log.info(f"Intervention: {cand}"); strategies.append(cand)
-                elif perc not in perc_false:
-                    if control_direct_percolation(primes, cand, [target]) or control_completeness(primes, cand, target, update):
-                        perc_true.append(perc); strategies.append(cand)
-                    else: perc_false.append(perc)
+    sizes = range(max(0, start - len(common)), limit + 1 - len(common))
+    cand_vars, values = _candidate_values(primes, [target], cand_vars, common, sizes, prune)
+    ckpt, strategies, stream = _open_search(primes, target, update, "completeness", cand_vars, sizes, common, checkpoint, cache, known, values)
+    found = SubspaceIndex(strategies)
+    for idx, cand in stream:
+        if not found.has_superspace(cand):
+            perc = cache.percolate(cand)
+            verdict = cache.verdict(perc, target, update, "completeness")
+            if verdict: log.info(f"Intervention: {cand}")
+            elif verdict is None:
+                with stage("check"):
+                    verdict = control_direct_percolation(primes, cand, [target], perc) or control_completeness(primes, cand, target, update, perc)
+                cache.set_verdict(perc, target, update, "completeness", verdict)
+            if verdict: strategies.append(cand); found.add(cand)
+        ckpt.resolve(idx); ckpt.tick(strategies)
+    ckpt.save(strategies); cache.save()
     return strategies
 
 # --- Model-checking-based computation ----------------------------------------
 
 def compute_control_strategies_with_model_checking(primes, target, update="asynchronous", limit=3,
-                                                   avoid=None, max_traps=1_000_000, start=0, known=None):
-    """Enumerate model-checking-based control strategies."""
+                                                   avoid=None, max_traps=1_000_000, start=0, known=None, cache=None,
+                                                   checkpoint=None, prune=None):
+    """
+    Enumerate model-checking-based control strategies (*cache*: a PercolationCache to share/persist;
+    *checkpoint*: file to save progress to periodically and resume from; *prune*: "reachability" or "signs" (lossy)
+    to drop candidates by static analysis first, see candidate_pruning.prune_candidates).
+    """
     if not isinstance(target, list): return log.error("Target must be list.")
     avoid, known = avoid or [], known or []
+    cache = cache or PercolationCache(primes)
     common = find_common_variables_in_control_strategies(primes, target)
     cand_vars = [v for v in primes if v not in common and v not in avoid]
     log.info(f"Common vars: {len(common)} | Candidates: {len(cand_vars)}")
-    strategies, perc_true, perc_false = known[:], known[:], []
-    for i in range(max(0, start - len(common)), limit + 1 - len(common)):
-        log.info(f"Checking size {i + len(common)}")
-        for vs in tqdm.tqdm(combinations(cand_vars, i), total=math.comb(len(cand_vars), i)):
-            for ss in product(*[(0, 1)] * i):
-                cand = dict(zip(vs, ss)); cand.update(common)
-                if any(is_included_in_subspace(cand, x) for x in strategies): continue
-                perc = find_constants(percolate(primes, add_constants=cand, copy=True))
-                if perc in perc_true:
-                    log.info(f"Intervention: {cand}"); strategies.append(cand)
-                elif perc not in perc_false:
-                    if control_direct_percolation(primes, cand, target) or control_model_checking(primes, cand, target, update):
-                        perc_true.append(perc); strategies.append(cand)
-                    else: perc_false.append(perc)
+    sizes = range(max(0, start - len(common)), limit + 1 - len(common))
+    cand_vars, values = _candidate_values(primes, target, cand_vars, common, sizes, prune)
+    ckpt, strategies, stream = _open_search(primes, target, update, "model_checking", cand_vars, sizes, common, checkpoint, cache, known, values)
+    found = SubspaceIndex(strategies)
+    for idx, cand in stream:
+        if not found.has_superspace(cand):
+            perc = cache.percolate(cand)
+            verdict = cache.verdict(perc, target, update, "model_checking")
+            if verdict: log.info(f"Intervention: {cand}")
+            elif verdict is None:
+                with stage("check"):
+                    verdict = control_direct_percolation(primes, cand, target, perc) or control_model_checking(primes, cand, target, update, perc=perc)
+                cache.set_verdict(perc, target, update, "model_checking", verdict)
+            if verdict: strategies.append(cand); found.add(cand)
+        ckpt.resolve(idx); ckpt.tick(strategies)
+    ckpt.save(strategies); cache.save()
     return strategies
 
 # --- Parallel version ---------------------------------------------------------
 
-def _evaluate_candidate(args):
+worker_state = {}
+
+def init_worker(primes, target, update, query_cache_dir=None, instrument=None, model_checker=None):
     """
-    Worker for parallel control strategy evaluation.
-    Each worker uses its own temp dir to avoid NuSMV deadlocks.
+    Pool initializer: ship the network to each worker once instead of once per task.
+    Each worker gets its own scratch dir (removed when the worker exits) to avoid NuSMV deadlocks.
+    *instrument*: the parent's instrumentation settings; a forked worker must not report what the parent recorded before.
+    *model_checker*: the parent's query backend (see set_model_checker), if not inherited.
     """
-    primes, candidate, target, update = args
-    import tempfile, shutil, os
+    worker_state.update(primes=primes, target=target, update=update)
+    if model_checker: set_model_checker(model_checker)
+    if instrument is not None: enable(**instrument)
+    else: disable()
+    if query_cache_dir: set_query_cache(QueryCache(path=query_cache_dir))
+    set_trap_space_threads(1)  # the pool already keeps every core busy
     tmpdir = tempfile.mkdtemp(prefix=f"pyboolnet_{os.getpid()}_")
-    os.environ["PYBOOLNET_TMPDIR"] = tmpdir
+    # pyboolnet writes its SMV/ASP files through tempfile, so point that at tmpdir as well
+    os.environ["PYBOOLNET_TMPDIR"] = os.environ["TMPDIR"] = tempfile.tempdir = tmpdir
+    Finalize(None, shutil.rmtree, args=(tmpdir,), kwargs={"ignore_errors": True}, exitpriority=0)
+
+def make_pool(n_jobs, initargs, cluster=None):
+    """
+    The executor of the parallel enumerators: *n_jobs* local processes, or with *cluster* (keyword arguments of
+    work_queue.ClusterExecutor, e.g. {"address": ("0.0.0.0", 6000)}) the worker processes that connect to it.
+    """
+    if cluster is None: return ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker, initargs=initargs)
+    return ClusterExecutor(**cluster, initializer=init_worker, initargs=initargs)
+
+def _evaluate_candidate(candidate, perc):
+    """
+    Worker for parallel control strategy evaluation (model checking only;
+    the dispatcher has already ruled out direct percolation).
+    """
+    primes, target, update = worker_state["primes"], worker_state["target"], worker_state["update"]
     try:
-        perc = find_constants(primes=percolate(primes=primes, add_constants=candidate, copy=True))
-        if control_direct_percolation(primes, candidate, target):
-            result = (candidate, perc, True)
-        elif control_model_checking(primes, candidate, target, update):
-            result = (candidate, perc, True)
-        else:
-            result = (candidate, perc, False)
+        return candidate, bool(control_model_checking(primes, candidate, target, update, perc=perc))
     except Exception as e:
-        result = (candidate, None, f"ERROR: {e}")
-    finally:
-        shutil.rmtree(tmpdir, ignore_errors=True)
-    return result
+        return candidate, f"ERROR: {e}"
+
+def _run_task(evaluate, candidate, perc):
+    """Pool task: (candidate, status) of *evaluate*, plus what the worker recorded for the instrumentation since its last task."""
+    with stage("task"):
+        candidate, status = evaluate(candidate, perc)
+    return candidate, status, drain()
+
+def dispatch(exe, cache, target, update, stream, strategies, window, ckpt, method="model_checking", evaluate=_evaluate_candidate):
+    """
+    Feed the (index, candidate) *stream* to the workers (*evaluate*: the task run per candidate,
+    *method*: its key in the verdict cache), pruning like the serial enumerator does.
+    Supersets of known strategies and candidates whose percolation already has a
+    verdict never reach a worker. Candidates that depend on unfinished work (a
+    running or held subset, or an identical percolation) are held back; since the stream
+    grows in size, no candidate in flight is a superset of a strategy found later.
+    Resolved indices go to *ckpt*.
+    """
+    running, held = {}, []  # future -> (idx, cand, perc); [(idx, cand, perc)]
+    found = SubspaceIndex(strategies)
+
+    def pending():
+        return chain(running.values(), held)
+
+    def settle(idx, cand, perc):
+        verdict = cache.verdict(perc, target, update, method)
+        if found.has_superspace(cand) or verdict is False: return ckpt.resolve(idx)
+        if any(is_included_in_subspace(cand, c) for _, c, _ in pending()): held.append((idx, cand, perc))
+        elif verdict or any(is_included_in_subspace(perc, t) for t in target):
+            cache.set_verdict(perc, target, update, method, True)
+            log.info(f"Intervention: {cand}"); strategies.append(cand); found.add(cand); ckpt.resolve(idx)
+        elif any(p == perc for _, _, p in pending()): held.append((idx, cand, perc))
+        else: running[exe.submit(_run_task, evaluate, cand, perc)] = (idx, cand, perc)
+
+    stream = iter(stream)
+    while True:
+        for idx, cand in islice(stream, max(0, window - len(running) - len(held))):
+            settle(idx, cand, cache.percolate(cand))
+        if not running and not held: break
+        done, _ = wait(running, return_when=FIRST_COMPLETED) if running else ((), ())
+        for fut in done:
+            (idx, cand, perc), (_, status, recorded) = running.pop(fut), fut.result()
+            ckpt.resolve(idx); merge(recorded)
+            if isinstance(status, str):
+                log.warning(f"Error {cand}: {status}"); continue
+            cache.set_verdict(perc, target, update, method, status)
+            if status and not found.has_superspace(cand):
+                log.info(f"Intervention (by {method}): {cand}"); strategies.append(cand); found.add(cand)
+        waiting, held[:] = held[:], []
+        for item in waiting: settle(*item)
+        ckpt.tick(strategies)
 
 def compute_control_strategies_with_model_checking_parallel(primes, target, update="asynchronous",
                                                             limit=3, avoid=None, max_traps=1_000_000,
-                                                            start=0, known=None, n_jobs=None):
-    """Parallel model-checking-based strategy computation."""
+                                                            start=0, known=None, n_jobs=None, window=None, cache=None,
+                                                            query_cache_dir=None, checkpoint=None, prune=None, cluster=None):
+    """
+    Parallel model-checking-based strategy computation; candidates are streamed, at most *window* in flight.
+    Workers share NuSMV verdicts through *query_cache_dir*, if given. Progress is saved
+    periodically to *checkpoint* and resumed from it. *prune*: see compute_control_strategies_with_model_checking.
+    With *cluster* (see make_pool) the candidates go to the workers of a work_queue.ClusterExecutor instead of a local pool;
+    *n_jobs* is then the number of workers expected, which sizes the window.
+    """
     avoid, known = avoid or [], known or []
-    strategies, perc_true, perc_false = known[:], known[:], []
+    cache = cache or PercolationCache(primes)
     n_jobs = n_jobs or (os.cpu_count() or 1)
-    tmpdir = tempfile.mkdtemp(prefix="pyboolnet_")
-    log.info(f"Created temp dir: {tmpdir}")
+    window = window or 4 * n_jobs
     common = find_common_variables_in_control_strategies(primes, target)
     cand_vars = [v for v in primes if v not in common and v not in avoid]
     log.info(f"Common vars: {len(common)} | Candidates: {len(cand_vars)}")
 
-    for i in range(max(0, start - len(common)), limit + 1 - len(common)):
-        tasks = [(primes, {**dict(zip(vs, ss)), **common}, target, update)
-                 for vs in combinations(cand_vars, i) for ss in product(*[(0, 1)] * i)
-                 if not any(is_included_in_subspace({**dict(zip(vs, ss)), **common}, x) for x in strategies)]
-
-        with ProcessPoolExecutor(max_workers=n_jobs) as exe:
-            for fut in tqdm.tqdm(as_completed([exe.submit(_evaluate_candidate, t) for t in tasks]), total=len(tasks), desc=f"size={i}"):
-                cand, perc, status = fut.result()
-                if isinstance(status, str) and status.startswith("ERROR"):
-                    log.warning(f"Error {cand}: {status}"); continue
-                if perc in perc_true: strategies.append(cand)
-                elif perc not in perc_false:
-                    (perc_true if status else perc_false).append(perc)
-                    if status: strategies.append(cand)
-
-    try: shutil.rmtree(tmpdir); log.info(f"Deleted temp dir: {tmpdir}")
-    except Exception as e: log.warning(f"Could not delete {tmpdir}: {e}")
+    sizes = range(max(0, start - len(common)), limit + 1 - len(common))
+    cand_vars, values = _candidate_values(primes, target, cand_vars, common, sizes, prune)
+    ckpt, strategies, stream = _open_search(primes, target, update, "model_checking", cand_vars, sizes, common, checkpoint, cache, known, values)
+    with make_pool(n_jobs, (primes, target, update, query_cache_dir, settings(), _model_checker), cluster) as exe:
+        dispatch(exe, cache, target, update, stream, strategies, window, ckpt)
+    ckpt.save(strategies); cache.save()
     return strategies
+
+# --- Rank-chunked parallel version ---------------------------------------------
+
+RANGE_VERDICTS = 1 << 16  # verdicts a worker of the chunked enumerator keeps between ranges
+
+def _evaluate_range(cand_vars, common, values, size, first, last, known):
+    """
+    Worker for the chunked enumerator: check the candidates of rank *first* to *last* - 1 of *size* that are no superset
+    of the *known* strategies, percolating them in one batch. Returns (ranks of the strategies, seconds, instrumentation).
+    """
+    start = time.perf_counter()
+    primes, target, update = worker_state["primes"], worker_state["target"], worker_state["update"]
+    cache = worker_state.get("cache")
+    if cache is None or cache.primes is not primes: cache = worker_state["cache"] = PercolationCache(primes)
+    # A candidate is in one range only, so just the verdicts are worth keeping from the earlier ranges, up to a bound
+    cache.percolations.clear()
+    if len(cache.verdicts) > RANGE_VERDICTS: cache.verdicts.clear()
+    found = SubspaceIndex(known)
+    todo = [(r, c) for r, c in enumerate(CandidateRanks(cand_vars, size, common, values).iter_range(first, last), first) if not found.has_superspace(c)]
+    with stage("percolation.batch"):
+        cache.prefetch([c for _, c in todo])
+    hits = []
+    for r, cand in todo:
+        perc = cache.percolate(cand)
+        verdict = cache.verdict(perc, target, update, "model_checking")
+        if verdict is None:
+            with stage("check"):
+                verdict = control_direct_percolation(primes, cand, target, perc) or control_model_checking(primes, cand, target, update, perc=perc)
+            cache.set_verdict(perc, target, update, "model_checking", verdict)
+        if verdict: hits.append(r)  # candidates of one size are never supersets of each other
+    return hits, time.perf_counter() - start, drain()
+
+def _unresolved_ranges(ckpt, offset, total):
+    """The ranges [first, last) of the ranks of a size level (at *offset* in the enumeration) that *ckpt* has not resolved."""
+    first = max(0, ckpt.position - offset)
+    for r in sorted(d - offset for d in ckpt.done if offset + first <= d < offset + total):
+        if first < r: yield first, r
+        first = r + 1
+    if first < total: yield first, total
+
+def _restored_level(strategies, n_known, ranks):
+    """Move the restored (not known) strategies of the size of *ranks* to the end of *strategies*; return them as (rank, strategy)."""
+    level = []
+    for cand in strategies[n_known:]:
+        try: level.append((ranks.rank(cand), cand))
+        except ValueError: pass
+    if level:
+        moved = {id(c) for _, c in level}
+        strategies[n_known:] = [s for s in strategies[n_known:] if id(s) not in moved] + [c for _, c in level]
+    return level
+
+class ChunkSizer:
+    """
+    Adaptive chunk sizes for the chunked enumerator: aims at *seconds* of work per chunk from a moving average of the
+    cost per candidate, so chunks shrink where candidates need model checking and grow where they only percolate,
+    and stay below a share of what is left of a size level so that the workers finish it together.
+    """
+
+    def __init__(self, n_jobs, seconds=2.0, first=16, largest=1 << 16):
+        self.n_jobs, self.seconds, self.size, self.largest, self.cost = n_jobs, seconds, first, largest, None
+
+    def next(self, remaining):
+        return max(1, min(self.size, self.largest, remaining // (2 * self.n_jobs) or 1, remaining))
+
+    def update(self, n, seconds):
+        cost = seconds / max(n, 1)
+        self.cost = cost if self.cost is None else 0.7 * self.cost + 0.3 * cost
+        self.size = max(1, min(self.largest, int(self.seconds / max(self.cost, 1e-7))))
+
+def compute_control_strategies_with_model_checking_chunked(primes, target, update="asynchronous", limit=3, avoid=None,
+                                                           start=0, known=None, n_jobs=None, cache=None, query_cache_dir=None,
+                                                           checkpoint=None, prune=None, cluster=None, chunk_seconds=2.0):
+    """
+    Parallel model-checking-based strategy computation with ranges of candidates as tasks instead of single candidates:
+    a task is a (size, first rank, last rank) range of the enumeration order (see CandidateRanks), which the worker
+    unranks, prunes, percolates in one batch and checks, so cheap candidates cost no scheduling or pickling. Chunk sizes
+    adapt to the cost per candidate (see ChunkSizer, *chunk_seconds* of work per chunk). The sizes are done one after
+    the other, each worker pruning with the strategies of the smaller sizes; the strategies come out in enumeration
+    order, the same as compute_control_strategies_with_model_checking. Unlike the parallel version, percolation
+    verdicts are not shared between workers (NuSMV verdicts are, through *query_cache_dir*).
+    *checkpoint* is compatible with the other model-checking enumerators; *cluster*: see make_pool.
+    """
+    avoid, known = avoid or [], known or []
+    cache = cache or PercolationCache(primes)
+    n_jobs = n_jobs or (os.cpu_count() or 1)
+    common = find_common_variables_in_control_strategies(primes, target)
+    cand_vars = [v for v in primes if v not in common and v not in avoid]
+    log.info(f"Common vars: {len(common)} | Candidates: {len(cand_vars)}")
+    sizes = range(max(0, start - len(common)), limit + 1 - len(common))
+    cand_vars, values = _candidate_values(primes, target, cand_vars, common, sizes, prune)
+    ckpt = Checkpoint(checkpoint, (network_hash(primes), freeze_target(target), update, "model_checking",
+                                   tuple(cand_vars), tuple(sizes), freeze(common)) + ((tuple(values.items()),) if values else ()))
+    strategies = ckpt.restore(known[:])
+    levels = [CandidateRanks(cand_vars, i, common, values) for i in sizes]
+    sizer, offset = ChunkSizer(n_jobs, chunk_seconds), 0
+    bar = tqdm.tqdm(total=sum(r.total for r in levels), initial=ckpt.position + len(ckpt.done))
+    with make_pool(n_jobs, (primes, target, update, query_cache_dir, settings(), _model_checker), cluster) as exe:
+        for ranks in levels:
+            # The restored strategies of this size move to the end, where the level is put in rank order once done
+            level = _restored_level(strategies, len(known), ranks)
+            todo = deque(_unresolved_ranges(ckpt, offset, ranks.total))
+            left, running, smaller = sum(b - a for a, b in todo), {}, tuple(strategies)
+            while todo or running:
+                while todo and len(running) < 2 * n_jobs:
+                    first, end = todo.popleft()
+                    last = min(end, first + sizer.next(left))
+                    if last < end: todo.appendleft((last, end))
+                    running[exe.submit(_evaluate_range, cand_vars, common, values, ranks.size, first, last, smaller)] = (first, last)
+                    left -= last - first
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    first, last = running.pop(fut)
+                    found, seconds, recorded = fut.result()
+                    merge(recorded); sizer.update(last - first, seconds)
+                    for r in found:
+                        cand = ranks.unrank(r)
+                        log.info(f"Intervention (by model_checking): {cand}"); strategies.append(cand); level.append((r, cand))
+                    for idx in range(offset + first, offset + last): ckpt.resolve(idx)
+                    bar.update(last - first)
+                ckpt.tick(strategies)
+            if level: strategies[len(strategies) - len(level):] = [cand for _, cand in sorted(level, key=lambda x: x[0])]
+            offset += ranks.total
+    bar.close()
+    ckpt.save(strategies); cache.save()
+    return strategies
+
+# --- Several targets at once --------------------------------------------------
+
+def classify_candidate(primes, cand, targets, update, max_traps=10_000_000, perc=None):
+    """
+    Model-checking check of *cand* against several targets ({name: target}) at once: the reduction and the minimal
+    trap spaces are computed once, and a target drops out as soon as a trap space rules it out. Returns {name: verdict}.
+    """
+    perc = _percolate(primes, cand) if perc is None else perc
+    verdicts = {n: True for n, t in targets.items() if any(is_included_in_subspace(perc, s) for s in t)}
+    alive = {n: t for n, t in targets.items() if n not in verdicts}
+    if not alive: return verdicts
+    new = fix_components_and_reduce(primes, perc, list({k for t in alive.values() for s in t for k in s}))
+    outside = {n: [] for n in alive}
+    for ts in stage_iter("trap_spaces", iter_trap_spaces(new, "min", max_output=max_traps)):
+        for n in list(alive):
+            if not any(dicts_are_consistent(ts, s) for s in alive[n]): verdicts[n] = False; del alive[n]
+            elif not any(is_included_in_subspace(ts, s) for s in alive[n]): outside[n].append(ts)
+        if not alive: break
+    for n, t in alive.items():
+        verdicts[n] = bool(control_is_valid_in_trap_spaces(new, outside[n], t, update) and run_control_query(new, t, update))
+    return verdicts
+
+def _evaluate_candidate_targets(candidate, perc, names):
+    """Worker for compute_control_strategies_for_targets: classify *candidate* against the targets *names*."""
+    targets, primes, update = worker_state["target"], worker_state["primes"], worker_state["update"]
+    try:
+        return candidate, classify_candidate(primes, candidate, {n: targets[n] for n in names}, update, perc=perc)
+    except Exception as e:
+        return candidate, f"ERROR: {e}"
+
+def compute_control_strategies_for_targets(primes, targets: Dict[str, List[dict]], update="asynchronous", limit=3,
+                                           avoid=None, start=0, cache=None, checkpoint=None, n_jobs=1, window=None,
+                                           query_cache_dir=None, prune=None, cluster=None) -> Dict[str, List[dict]]:
+    """
+    Model-checking-based strategies for several targets ({name: list of subspaces}, e.g. the phenotypes) in one enumeration.
+    Each candidate is percolated, reduced and its minimal trap spaces enumerated once, then classified against all targets
+    it is not already a superset of a strategy of (see classify_candidate). Returns {name: strategies}, the same strategies
+    as one compute_control_strategies_with_model_checking run per target. Targets with different common variables are
+    enumerated in separate passes. With *n_jobs* > 1 or a *cluster* the candidates are checked in a process pool or on the
+    cluster (see the parallel version).
+    """
+    avoid = avoid or []
+    cache = cache or PercolationCache(primes)
+    groups = {}
+    for name, target in targets.items():
+        groups.setdefault(freeze(find_common_variables_in_control_strategies(primes, target)), []).append(name)
+    table = {name: [] for name in targets}
+    for i, (common, names) in enumerate(groups.items()):
+        path = checkpoint if checkpoint is None or len(groups) == 1 else f"{checkpoint}.{i}"
+        for name, cs in _targets_pass(primes, {n: targets[n] for n in names}, dict(common), update, limit, avoid, start,
+                                      cache, path, n_jobs, window, query_cache_dir, prune, cluster):
+            table[name].append(cs)
+    cache.save()
+    return table
+
+def _targets_pass(primes, targets, common, update, limit, avoid, start, cache, checkpoint, n_jobs, window, query_cache_dir, prune, cluster):
+    """One enumeration for targets with the same common variables; returns the (name, strategy) pairs found."""
+    cand_vars = [v for v in primes if v not in common and v not in avoid]
+    log.info(f"Targets: {', '.join(targets)} | Common vars: {len(common)} | Candidates: {len(cand_vars)}")
+    sizes = range(max(0, start - len(common)), limit + 1 - len(common))
+    cand_vars, values = _candidate_values(primes, [s for t in targets.values() for s in t], cand_vars, common, sizes, prune)
+    ckpt, pairs, stream = _open_search(primes, targets, update, "model_checking", cand_vars, sizes, common, checkpoint, cache, [], values)
+    found = {n: SubspaceIndex([cs for m, cs in pairs if m == n]) for n in targets}
+
+    def record(name, cand, perc, verdict):
+        cache.set_verdict(perc, targets[name], update, "model_checking", verdict)
+        if verdict and not found[name].has_superspace(cand):
+            log.info(f"Intervention ({name}): {cand}"); pairs.append((name, cand)); found[name].add(cand)
+
+    def undecided(cand, perc):
+        """The targets *cand* still has to be checked against; cached and direct-percolation verdicts are recorded."""
+        todo = {}
+        for n, t in targets.items():
+            if found[n].has_superspace(cand): continue
+            verdict = cache.verdict(perc, t, update, "model_checking")
+            if verdict is None and any(is_included_in_subspace(perc, s) for s in t): verdict = True
+            if verdict is None: todo[n] = t
+            elif verdict: record(n, cand, perc, True)
+        return todo
+
+    if n_jobs > 1 or cluster:
+        with make_pool(n_jobs, (primes, targets, update, query_cache_dir, settings(), _model_checker), cluster) as exe:
+            _dispatch_targets(exe, stream, window or 4 * n_jobs, ckpt, pairs, cache, undecided, record)
+    else:
+        for idx, cand in stream:
+            perc = cache.percolate(cand)
+            todo = undecided(cand, perc)
+            if todo:
+                with stage("check"):
+                    verdicts = classify_candidate(primes, cand, todo, update, perc=perc)
+                for n, verdict in verdicts.items(): record(n, cand, perc, verdict)
+            ckpt.resolve(idx); ckpt.tick(pairs)
+    ckpt.save(pairs)
+    return pairs
+
+def _dispatch_targets(exe, stream, window, ckpt, pairs, cache, undecided, record):
+    """
+    :func:`dispatch` for several targets: a candidate is held back while a subset of it (or a candidate with the same percolation)
+    is in flight, since its verdicts may make it a superset of a strategy; otherwise its undecided targets go to a worker.
+    """
+    running, held = {}, []  # future -> (idx, cand, perc); [(idx, cand, perc)]
+
+    def settle(idx, cand, perc):
+        if any(is_included_in_subspace(cand, c) or p == perc for _, c, p in chain(running.values(), held)):
+            return held.append((idx, cand, perc))
+        todo = undecided(cand, perc)
+        if not todo: return ckpt.resolve(idx)
+        running[exe.submit(_run_task, partial(_evaluate_candidate_targets, names=tuple(todo)), cand, perc)] = (idx, cand, perc)
+
+    stream = iter(stream)
+    while True:
+        for idx, cand in islice(stream, max(0, window - len(running) - len(held))):
+            settle(idx, cand, cache.percolate(cand))
+        if not running and not held: break
+        done, _ = wait(running, return_when=FIRST_COMPLETED) if running else ((), ())
+        for fut in done:
+            (idx, cand, perc), (_, verdicts, recorded) = running.pop(fut), fut.result()
+            ckpt.resolve(idx); merge(recorded)
+            if isinstance(verdicts, str):
+                log.warning(f"Error {cand}: {verdicts}"); continue
+            for n, verdict in verdicts.items(): record(n, cand, perc, verdict)
+        waiting, held[:] = held[:], []
+        for item in waiting: settle(*item)
+        ckpt.tick(pairs)
@@ -1,17 +1,22 @@
+import io, logging, time
 from itertools import combinations, product
 from os import system
-from typing import List
-from clingo import Control
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+from clingo import Control, parse_term
 from pprint import pformat
+from pyboolnet.external.potassco import primes2asp
+from pyboolnet.prime_implicants import active_primes
 from pyboolnet.trap_spaces import compute_trap_spaces, compute_trapspaces_that_intersect_subspace
+from instrumentation import stage, stage_iter
+from subspaces import SubspaceIndex, is_included_in_subspace
 
-def run_node_edge_control_asp(program_instance: str):  
-    
-    ctl = Control(arguments=[f"--models=0", "--opt-mode=optN", "--enum-mode=domRec", "--heuristic=Domain", "--dom-mod=5,16",])
-    
-    ctl.add(name="base", parameters={}, program=program_instance)
-    
-    ctl.add(name="base", parameters={}, program="""
+log = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.1  # seconds between checks of the time budget and the cancel hook
+
+CLINGO_ARGUMENTS = ["--models=0", "--opt-mode=optN", "--enum-mode=domRec", "--heuristic=Domain", "--dom-mod=5,16"]
+
+CONTROL_ENCODING = """
         goal(T,S) :- goal(Z,T,S), Z < 0.
         satisfy(V,W,S) :- formula(W,D); dnf(D,C); clause(C,V,S).
         closure(V,T)   :- goal(V,T).
@@ -44,53 +49,332 @@ def run_node_edge_control_asp(program_instance: str):
         not satisfied(Z) :- goal(Z,T,S), not eval_formula(Z,T,S), subspace(Z).
         satisfied(Z) :- eval_formula(Z,T,S) : goal(Z,T,S); subspace(Z).
         0 < { satisfied(Z) : subspace(Z) }.
-        :- maxsize>0; maxsize + 1 { node(V,R); edge(Vi,Vj,S) }.
-        :- maxnodes<0; 1 { node(V,S) }.
-        :- maxedges<0; 1 { edge(Vi,Vj,S) }.
+        :- maxsize(M); M > 0; M + 1 { node(V,R); edge(Vi,Vj,S) }.
+        :- maxnodes(M); M < 0; 1 { node(V,S) }.
+        :- maxedges(M); M < 0; 1 { edge(Vi,Vj,S) }.
         #show node/2.
         #show edge/3.
-        """)
+        """
+
+
+def run_node_edge_control_asp(program_instance: str):  
+    
+    return list(iter_models(_ground(program_instance)))
+
+
+def _ground(program_instance: str) -> Control:
+    """
+    Returns a clingo control object with *program_instance* and the control encoding grounded.
+    """
+
+    ctl = Control(arguments=CLINGO_ARGUMENTS)
     
-    ctl.ground([("base", [])])
+    ctl.add(name="base", parameters={}, program=program_instance)
     
-    models = []
-    with ctl.solve(yield_=True) as handle:
-        for model in handle:
-            models.append(model.symbols(shown=True))
+    ctl.add(name="base", parameters={}, program=CONTROL_ENCODING)
+    
+    with stage("asp.ground"):
+        ctl.ground([("base", [])])
+
+    return ctl
 
-    return models
+
+def iter_models(ctl: Control, max_count: Optional[int] = None, timeout: Optional[float] = None, cancel: Optional[Callable[[], bool]] = None) -> Iterator[list]:
+    """
+    Solves the grounded program in *ctl* and yields the shown symbols of each model as soon as clingo finds it.
+    The search stops after *max_count* models, after *timeout* seconds of wall-clock time, or once *cancel()* returns True.
+    Closing the generator early also stops the search.
+
+    **arguments**:
+        * *ctl*: grounded clingo control object.
+        * *max_count* (int): maximum number of models. Default value: None (all models).
+        * *timeout* (float): time budget in seconds for the whole enumeration. Default value: None (no budget).
+        * *cancel*: function without arguments that is polled while solving; returning True stops the search. Default value: None.
+    **returns**:
+        * Models (generator): lists of clingo symbols.
+    **example**::
+        >>> for model in iter_models(ctl, max_count=10, timeout=60):
+        ...     print(model)
+    """
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    count = 0
+    with ctl.solve(yield_=True, async_=True) as handle:
+        while max_count is None or count < max_count:
+            if cancel is not None and cancel():
+                return
+            handle.resume()
+            # Without a budget or a cancel hook there is nothing to poll for: block until the next model
+            poll = None if deadline is None and cancel is None else POLL_INTERVAL
+            while not handle.wait(poll if deadline is None else max(0.0, min(poll, deadline - time.monotonic()))):
+                if (cancel is not None and cancel()) or (deadline is not None and time.monotonic() >= deadline):
+                    handle.cancel()
+                    return
+            model = handle.model()
+            if model is None:
+                return
+            count = count + 1
+            yield model.symbols(shown=True)
+
+
+TRAP_SPACE_ARGUMENTS = {"min": ["--enum-mode=domRec", "--heuristic=Domain", "--dom-mod=3,16"],
+                        "max": ["--enum-mode=domRec", "--heuristic=Domain", "--dom-mod=5,16"]}
+
+
+def iter_trap_spaces(primes: dict, type_: str = "min", within: dict = None, intersecting: dict = None, max_output: Optional[int] = None, timeout: Optional[float] = None, cancel: Optional[Callable[[], bool]] = None) -> Iterator[dict]:
+    """
+    Generator version of pyboolnet's compute_trap_spaces: yields the trap spaces of *primes* as clingo finds them,
+    so callers can filter them (or stop) while they are produced and only keep the relevant ones.
+    Trap spaces outside *within* or disjoint from *intersecting* are not returned. These conditions are constraints of the
+    ASP query whenever that does not change the meaning of *type_*, i.e. except for *within* with "max" and *intersecting*
+    with "min" (a trap space minimal among those intersecting a subspace need not be minimal); then the output is filtered.
+
+    **arguments**:
+        * *primes*: prime implicants.
+        * *type_*: either "min", "max", "all" or "percolated".
+        * *within*: subspace that must contain the trap spaces. Default value: None.
+        * *intersecting*: subspace that the trap spaces must intersect. Default value: None.
+        * *max_output* (int): maximal number of returned trap spaces. Default value: None (all).
+        * *timeout*, *cancel*: see :func:`iter_models`.
+    **returns**:
+        * Trap spaces (generator): dicts.
+    **example**::
+        >>> for ts in iter_trap_spaces(primes, "percolated", within={"FA_b1": 1}):
+        ...     print(ts)
+    """
+
+    extra_lines, filters = [], []
+    if within:
+        if type_ == "max":
+            filters.append(lambda ts: is_included_in_subspace(ts, within))
+        else:
+            extra_lines += [f":- not hit({asp_name(v)},{x})." for v, x in within.items()]
+    if intersecting:
+        if type_ == "min":
+            filters.append(lambda ts: all(ts.get(v, x) == x for v, x in intersecting.items()))
+        else:
+            extra_lines += [f":- hit({asp_name(v)},{1 - x})." for v, x in intersecting.items()]
+
+    bounds = (1, len(primes)) if type_ == "max" else None
+    ctl = Control(arguments=["--models=0", "--project"] + TRAP_SPACE_ARGUMENTS.get(type_, []))
+    ctl.add(name="base", parameters={}, program=primes2asp(primes, None, bounds, [], type_, extra_lines))
+    with stage("trap_spaces.ground"):
+        ctl.ground([("base", [])])
+
+    count = 0
+    hits = {}  # hit/2 symbol -> (name, value); decoding each symbol through the clingo API every time dominates
+    for symbols in iter_models(ctl, timeout=timeout, cancel=cancel):
+        for s in symbols:
+            if s not in hits:
+                hits[s] = (s.arguments[0].string, s.arguments[1].number)
+        ts = dict(hits[s] for s in symbols)
+        if all(f(ts) for f in filters):
+            yield ts
+            count = count + 1
+            if count == max_output:
+                return
+
+
+class ControlSolver:
+    """
+    Multi-shot version of :func:`run_node_edge_control_asp` for one network.
+    The network facts (*formula/dnf/clause*, avoided nodes and edges) and the control encoding are grounded once.
+    The goal subspaces and the size bound of each query are switched on through external atoms,
+    so solving for several targets pays the grounding cost only once.
+
+    **arguments**:
+        * *primes*: prime implicants.
+        * *intervention_type*: "node", "edge" or "combined"/"both".
+        * *avoid_nodes*, *avoid_edges*: nodes and edges that cannot be part of the control strategies.
+        * *max_size*: largest size bound that will be requested. Default value: 3.
+        * *num_subspaces*: number of target subspaces (percolation goals) a query may use. Default value: 1.
+        * *num_trap_spaces*: number of target trap spaces a query may use. Default value: 0.
+    **example**::
+        >>> solver = ControlSolver(primes, "combined", avoid_nodes=["AJ_b1"])
+        >>> cs = read_asp_output(primes, solver.solve(target_subspaces=[{"FA_b1": 1}], max_size=2))
+    """
+
+    def __init__(self, primes: dict, intervention_type: str, avoid_nodes: List[str] = [], avoid_edges: List[tuple] = [], max_size: int = 3, num_subspaces: int = 1, num_trap_spaces: int = 0):
+        self.primes, self.intervention_type, self.max_size = primes, intervention_type, max_size
+        self.num_subspaces, self.num_trap_spaces = num_subspaces, num_trap_spaces
+        self.ctl = Control(arguments=CLINGO_ARGUMENTS)
+        self.ctl.add(name="base", parameters={}, program=_network_facts(primes, avoid_nodes, avoid_edges))
+        self.ctl.add(name="base", parameters={}, program=CONTROL_ENCODING)
+        self.ctl.add(name="base", parameters={}, program=f"""
+            slot(-{num_subspaces}..{num_trap_spaces - 1}). sign(-1;1).
+            #external subspace(Z) : slot(Z).
+            #external goal(Z,V,S) : slot(Z), formula(V,_), sign(S).
+            #external maxsize(0..{max_size}).
+            #external maxnodes(-1).
+            #external maxedges(-1).
+            """)
+        with stage("asp.ground"):
+            self.ctl.ground([("base", [])])
+        self.active = []
+
+    def fits(self, target_trap_spaces: List[dict] = [], target_subspaces: List[dict] = [], max_size: int = 3) -> bool:
+        """Whether a query of this shape can be answered without re-grounding."""
+        return len(target_subspaces) <= self.num_subspaces and len(target_trap_spaces) <= self.num_trap_spaces and max_size <= self.max_size
+
+    def solve(self, target_trap_spaces: List[dict] = [], target_subspaces: List[dict] = [], max_size: int = 3) -> List[list]:
+        """Returns the models (shown symbols) for the given goals, like :func:`run_node_edge_control_asp`."""
+        return list(self.iter_solve(target_trap_spaces, target_subspaces, max_size))
+
+    def iter_solve(self, target_trap_spaces: List[dict] = [], target_subspaces: List[dict] = [], max_size: int = 3, max_count: Optional[int] = None, timeout: Optional[float] = None, cancel: Optional[Callable[[], bool]] = None) -> Iterator[list]:
+        """Yields the models one at a time, see :func:`iter_models`. The generator must be exhausted or closed before the next query."""
+        if not self.fits(target_trap_spaces, target_subspaces, max_size):
+            raise ValueError("Query exceeds the subspaces or size bound the solver was grounded for.")
+        for atom in self.active:
+            self.ctl.assign_external(atom, False)
+        self.active = [parse_term(x) for x in _goal_atoms(target_trap_spaces, target_subspaces) + _size_atoms(self.intervention_type, max_size)]
+        for atom in self.active:
+            self.ctl.assign_external(atom, True)
+        yield from iter_models(self.ctl, max_count, timeout, cancel)
 
 
 def read_asp_output(primes: dict, models: List[list]):
 
-    lower_to_prime = {n.lower(): n for n in primes}
+    return [decode_model(x) for x in models]
+
+
+def decode_model(symbols: list) -> dict:
+    """
+    Returns the control strategy of one model: nodes map to their value, edges (source, target) to the value of the edge.
+    """
+
     value_to_boolean = {1:1, -1:0}
-    
-    cs_total = []
-    for x in models:
-        cs = {}
-        for y in x:
-            if y.name == "node":
-                cs[lower_to_prime[y.arguments[0].name]] = value_to_boolean[y.arguments[1].number]
-            if y.name == "edge":
-                cs[(lower_to_prime[y.arguments[0].name], lower_to_prime[y.arguments[1].name])] = value_to_boolean[y.arguments[2].number]
-        cs_total.append(cs)
-    
-    return cs_total
 
+    cs = {}
+    for y in symbols:
+        if y.name == "node":
+            cs[y.arguments[0].string] = value_to_boolean[y.arguments[1].number]
+        if y.name == "edge":
+            cs[(y.arguments[0].string, y.arguments[1].string)] = value_to_boolean[y.arguments[2].number]
+    return cs
+
+
+def run_control_problem(primes, target, intervention_type, control_type, avoid_nodes: dict = {}, avoid_edges: dict = {}, limit: int = 3, output_file: str = "", use_attractors: bool = True, complex_attractors: List[List[dict]] = [], solver: "ControlSolver" = None, store: "ResultStore" = None):
+    """
+    Computes the control strategies of *target* in ASP.
+    If a :class:`ControlSolver` for *primes* is given (built with the same intervention type and avoided nodes and edges),
+    it is reused instead of grounding the problem from scratch, as long as the query fits the solver.
+    If a :class:`result_store.ResultStore` is given, every strategy is appended to the table of
+    (*primes*, *target*, "<intervention_type>-<control_type>", *limit*) as soon as it is found.
+    """
+
+    strategies = iter_control_strategies(primes, target, intervention_type, control_type, avoid_nodes, avoid_edges, limit, use_attractors, complex_attractors, solver)
+    cs_asp = _collect(strategies, primes, target, f"{intervention_type}-{control_type}", limit, store)
+
+    # Saving output
+
+    if output_file != "":
+        with open(output_file+".py", "w") as f:
+            f.write("Target = " + pformat(target) + "\n")
+            f.write("#Control strategies using " + control_type + "\ncs = " + pformat(cs_asp) + "\n")
+
+    return cs_asp
+
+
+def _collect(strategies: Iterable[dict], primes: dict, target: dict, method: str, limit: int, store: "ResultStore" = None) -> List[dict]:
+    """
+    Returns *strategies* as a list, appending each one to its table of *store* (if given) as soon as it is found.
+    """
+
+    if store is None:
+        return list(strategies)
+    cs_asp = []
+    with store.table(primes, target, method, limit) as table:
+        for cs in strategies:
+            cs_asp.append(cs)
+            table.append(cs)
+    return cs_asp
 
-def run_control_problem(primes, target, intervention_type, control_type, avoid_nodes: dict = {}, avoid_edges: dict = {}, limit: int = 3, output_file: str = "", use_attractors: bool = True, complex_attractors: List[List[dict]] = []):
+
+def run_control_problems(primes, targets: Dict[str, dict], intervention_type, control_type, avoid_nodes: dict = {}, avoid_edges: dict = {}, limit: int = 3, use_attractors: bool = True, complex_attractors: List[List[dict]] = [], solver: "ControlSolver" = None, store: "ResultStore" = None) -> Dict[str, List[dict]]:
+    """
+    :func:`run_control_problem` for several targets of one network, e.g. the phenotypes.
+    The minimal trap spaces of *primes* are computed once for all targets, and unless a *solver* is given the problem is grounded once,
+    in a :class:`ControlSolver` large enough for the goals of every target, so each target only costs its own goals and solve.
+
+    **arguments**:
+        * *targets* (dict): name -> target subspace.
+        * the other arguments are those of :func:`run_control_problem`.
+    **returns**:
+        * *cs* (dict): name -> list of control strategies.
+    **example**::
+        >>> cs = run_control_problems(primes, {"E1": {"AJ_b1": 1, "FA_b1": 0}, "M1": {"AJ_b1": 0, "FA_b1": 1}}, "node", "percolation", limit=2)
+    """
+
+    tsmin = None
+    if control_type in ["trap_spaces", "transient", "both"]:
+        with stage("trap_spaces.min"):
+            tsmin = compute_trap_spaces(primes, "min")
+    goals = {}
+    for name, target in targets.items():
+        with stage("asp.goals"):
+            goals[name] = _control_goals(primes, target, control_type, use_attractors, complex_attractors, tsmin)
+    if solver is None:
+        solver = ControlSolver(primes, intervention_type, avoid_nodes, avoid_edges, limit,
+                               num_subspaces=max(len(g[1]) for g in goals.values()), num_trap_spaces=max(len(g[0]) for g in goals.values()))
+
+    cs = {}
+    for name, target in targets.items():
+        strategies = _iter_strategies_for_goals(primes, *goals[name], intervention_type, avoid_nodes, avoid_edges, limit, solver)
+        cs[name] = _collect(strategies, primes, target, f"{intervention_type}-{control_type}", limit, store)
+    return cs
+
+
+def iter_control_strategies(primes, target, intervention_type, control_type, avoid_nodes: dict = {}, avoid_edges: dict = {}, limit: int = 3, use_attractors: bool = True, complex_attractors: List[List[dict]] = [], solver: "ControlSolver" = None, max_count: Optional[int] = None, timeout: Optional[float] = None, cancel: Optional[Callable[[], bool]] = None) -> Iterator[dict]:
+    """
+    Generator version of :func:`run_control_problem`: yields the control strategies of *target* as clingo finds them,
+    so only one model is held in memory at a time. The search stops after *max_count* strategies, after *timeout* seconds
+    or once *cancel()* returns True (see :func:`iter_models`). Nothing is written to disk.
+
+    **example**::
+        >>> for cs in iter_control_strategies(primes, target, "node", "percolation", limit=2, max_count=20):
+        ...     print(cs)
+    """
+
+    with stage("asp.goals"):
+        target_trap_spaces, target_percolation = _control_goals(primes, target, control_type, use_attractors, complex_attractors)
+    return _iter_strategies_for_goals(primes, target_trap_spaces, target_percolation, intervention_type, avoid_nodes, avoid_edges, limit, solver, max_count, timeout, cancel)
+
+
+def _iter_strategies_for_goals(primes, target_trap_spaces, target_percolation, intervention_type, avoid_nodes, avoid_edges, limit, solver=None, max_count=None, timeout=None, cancel=None) -> Iterator[dict]:
+    """
+    Yields the control strategies for the goals of :func:`_control_goals`, see :func:`iter_control_strategies`.
+    """
+
+    # Computing CS in ASP
+
+    if solver is not None and solver.fits(target_trap_spaces, target_percolation, limit):
+        models = solver.iter_solve(target_trap_spaces=target_trap_spaces, target_subspaces=target_percolation, max_size=limit, max_count=max_count, timeout=timeout, cancel=cancel)
+    else:
+        program_instance = create_asp_program_instance(primes=primes, intervention_type=intervention_type, target_trap_spaces=target_trap_spaces, target_subspaces=target_percolation, max_size=limit, avoid_nodes=avoid_nodes, avoid_edges=avoid_edges, filename="program_instance")
+        models = iter_models(_ground(program_instance), max_count, timeout, cancel)
+    for model in stage_iter("asp.solve", models):
+        yield decode_model(model)
+
+
+def _control_goals(primes, target, control_type, use_attractors: bool = True, complex_attractors: List[List[dict]] = [], tsmin: List[dict] = None):
+    """
+    Returns the target trap spaces and the target subspaces (percolation goals) of the control problem.
+    *tsmin* are the minimal trap spaces of *primes*, if already known.
+    """
 
     # Setting targets and computing selected trap spaces
 
     if control_type in ["trap_spaces", "transient", "both"]:
-        tspaces = compute_trapspaces_that_intersect_subspace(primes=primes, subspace=target, type_="percolated", max_output=1000000)
-        if {} not in tspaces:
-            tspaces.append({})
-        tsmin = compute_trap_spaces(primes, "min")
+        # The trap spaces of compute_trapspaces_that_intersect_subspace, streamed into the selection so that only the
+        # selected ones are kept. Without attractors only those inside *target* can be selected, so ASP returns only those.
+        within = None if use_attractors else target
+        tspaces = stage_iter("trap_spaces", _with_empty_trap_space(iter_trap_spaces(active_primes(primes, target), "percolated", within=within, max_output=1000000)))
+        if tsmin is None:
+            with stage("trap_spaces.min"):
+                tsmin = compute_trap_spaces(primes, "min")
         target_trap_spaces = select_trapspaces(tspaces=tspaces, subspace=target, use_attractors=use_attractors, tsmin=tsmin, complex_attractors=complex_attractors)
         target_percolation = []
-        print("Num of selected trap spaces:", len(target_trap_spaces))
+        log.info("Num of selected trap spaces: %d", len(target_trap_spaces))
 
         if control_type == "transient":
             target_percolation = target_trap_spaces
@@ -101,20 +385,20 @@ def run_control_problem(primes, target, intervention_type, control_type, avoid_n
         target_trap_spaces = []
         target_percolation = [target]
 
-    # Computing CS in ASP
-
-    program_instance = create_asp_program_instance(primes=primes, intervention_type=intervention_type, target_trap_spaces=target_trap_spaces, target_subspaces=target_percolation, max_size=limit, avoid_nodes=avoid_nodes, avoid_edges=avoid_edges, filename="program_instance")
-    models = run_node_edge_control_asp(program_instance)
-    cs_asp = read_asp_output(primes, models)
+    return target_trap_spaces, target_percolation
 
-    # Saving output
 
-    if output_file != "":
-        with open(output_file+".py", "w") as f:
-            f.write("Target = " + pformat(target) + "\n")
-            f.write("#Control strategies using " + control_type + "\ncs = " + pformat(cs_asp) + "\n")
+def _with_empty_trap_space(tspaces: Iterable[dict]) -> Iterator[dict]:
+    """
+    Yields *tspaces* followed by the trivial trap space {}, unless it was among them.
+    """
 
-    return cs_asp
+    empty = False
+    for ts in tspaces:
+        empty = empty or not ts
+        yield ts
+    if not empty:
+        yield {}
 
 
 def create_asp_program_instance(primes: dict, intervention_type: str, target_trap_spaces: List[dict] = [], target_subspaces: List[dict] = [], max_size: int = 3, avoid_nodes: List[str] = [], avoid_edges: List[str] = [], filename: str = "") -> str:
@@ -123,87 +407,105 @@ def create_asp_program_instance(primes: dict, intervention_type: str, target_tra
     The output is a string. If *filename* is provided, it saves the output on a file.
     """
 
-    # Encoding of the Boolean function
-    nodes_to_avoid = ""
-    edges_to_avoid = ""
+    text = io.StringIO()
+    write_asp_program_instance(text, primes, intervention_type, target_trap_spaces, target_subspaces, max_size, avoid_nodes, avoid_edges)
+    final_text = text.getvalue()
+    if filename != "":
+        # Saving file
+        with open(filename + ".asp", "w") as file:
+            file.write(final_text)
+    return final_text
+
+
+def write_asp_program_instance(out: TextIO, primes: dict, intervention_type: str, target_trap_spaces: List[dict] = [], target_subspaces: List[dict] = [], max_size: int = 3, avoid_nodes: List[str] = [], avoid_edges: List[str] = []):
+    """
+    Streams the ASP encoding of the control strategy problem to *out*, one fact per line.
+    Use it instead of :func:`create_asp_program_instance` to write large instances straight to a file.
+
+    **arguments**:
+        * *out*: text stream with a *write* method, e.g. an open file or an io.StringIO.
+        * the other arguments are those of :func:`create_asp_program_instance`.
+    **example**::
+        >>> with open("program_instance.asp", "w") as f:
+        ...     write_asp_program_instance(f, primes, "node", target_subspaces=[{"FA_b1": 1}], max_size=2)
+    """
+
+    write_network_facts(out, primes, avoid_nodes, avoid_edges)
+    out.writelines(x + ".\n" for x in _goal_atoms(target_trap_spaces, target_subspaces))
+    out.writelines(x + ".\n" for x in _size_atoms(intervention_type, max_size))
+
+
+def write_network_facts(out: TextIO, primes: dict, avoid_nodes: List[str] = [], avoid_edges: List[str] = []):
+    """
+    Streams the Boolean functions of *primes* and the nodes and edges to avoid to *out* as ASP facts.
+    Node names are written as quoted ASP strings (see :func:`asp_name`), so they are kept verbatim.
+    The cost is linear in the size of *primes*.
+    """
+
     for x in avoid_edges:
-        edges_to_avoid = edges_to_avoid + "avoid_edge(" + x[0] + "," + x[1] + "). "
-    formulas = ""
-    dnfs = ""
-    clauses = ""
-    clauses_dict = dict()
-    primes_included = dict()
-    id_form = -1
-    cont_clause = 0
-    for x in primes.keys():
-        id_form = id_form + 1
+        out.write(f"avoid_edge({asp_name(x[0])},{asp_name(x[1])}).\n")
+    avoid_nodes = set(avoid_nodes)
+    id_clause = 0
+    for id_form, x in enumerate(primes):
+        name = asp_name(x)
         if x in avoid_nodes:
-            nodes_to_avoid = nodes_to_avoid + "avoid_node(" + x + "). "
-        formulas = formulas + "formula(" + x + ", " + str(id_form) + "). "
+            out.write(f"avoid_node({name}).\n")
+        out.write(f"formula({name},{id_form}).\n")
         for p in primes[x][1]:
-            id_clause = str(cont_clause)
-            cont_clause = cont_clause + 1
-            text_clause = ""
-            for y in p.keys():
-                value = str(p[y])
-                if str(p[y]) == "0":
-                    value = "-1"
-                text_clause = text_clause + "clause(" + id_clause + ", " + y + ", " + value + "). "
-            clauses_dict[id_clause] = text_clause
-            clauses = clauses + text_clause
-            dnfs = dnfs + "dnf(" + str(id_form) + ", " + id_clause + "). "
-    # Encoding goal subspaces
-    subspaces = ""
-    goals = ""
-
-    id_subspace = 0
-    for s in target_subspaces:
-        id_subspace = id_subspace - 1
-        subspaces = subspaces + f"subspace({id_subspace}). "
-        for x in s.keys():
-            value = str(s[x])
-            if str(s[x]) == "0":
-                value = "-1"
-            goals = goals + "goal(" + str(id_subspace) + ", " + x + ", " + value + "). "
-
-    id_subspace = -1
-    for s in target_trap_spaces:
-        id_subspace = id_subspace + 1
-        subspaces = subspaces + f"subspace({id_subspace}). "
-        for x in s.keys():
-            value = "-1" if str(s[x]) == "0" else str(s[x])
-            goals = goals + "goal(" + str(id_subspace) + ", " + x + ", " + value + "). "
+            out.write(f"dnf({id_form},{id_clause}).\n")
+            out.writelines(f"clause({id_clause},{asp_name(y)},{1 if v else -1}).\n" for y, v in p.items())
+            id_clause = id_clause + 1
 
-    max_nodes = max_size
-    max_edges = max_size
-    if intervention_type == "node":
-        max_edges = -1
-    if intervention_type == "edge":
-        max_nodes = -1
-    constants = "#const maxsize=" + str(max_size) + "." + "\n\n" + "#const maxnodes=" + str(max_nodes) + "." + "\n\n" + "#const maxedges=" + str(max_edges) + "."
 
-    final_text = nodes_to_avoid + "\n\n" + edges_to_avoid + "\n\n" + formulas + "\n\n" + dnfs + "\n\n" + clauses + "\n\n" + subspaces + "\n\n" + goals + "\n\n" + constants
-    if filename != "":
-        # Saving file
-        with open(filename + ".asp", "w") as file:
-            file.write(final_text.lower())
-    return final_text.lower()
+def _network_facts(primes: dict, avoid_nodes: List[str] = [], avoid_edges: List[str] = []) -> str:
+    """
+    Returns the facts of :func:`write_network_facts` as a string.
+    """
+
+    text = io.StringIO()
+    write_network_facts(text, primes, avoid_nodes, avoid_edges)
+    return text.getvalue()
 
 
-def is_included_in_subspace(subspace1: dict, subspace2: dict):
+def asp_name(node: str) -> str:
     """
-    Test whether *subspace1* is contained in *subspace2*.
+    Returns *node* as a quoted ASP string. Unlike lowercasing, this keeps distinct node names distinct.
 
-    **arguments**:
-        * *subspace1*, *subspace2* (dicts): subspaces.
-    **returns**:
-        * Answer (bool): whether *subspace1* is contained in *subspace2*.
     **example**::
-        >>> is_included_in_subspace({'v1': 0, 'v2': 1}, {'v2': 1})
-        True
+        >>> asp_name("Gene1")
+        '"Gene1"'
     """
 
-    return all(x in subspace1 and subspace1[x] == subspace2[x] for x in subspace2.keys())
+    return '"' + node.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _goal_atoms(target_trap_spaces: List[dict] = [], target_subspaces: List[dict] = []) -> List[str]:
+    """
+    Returns the *subspace/1* and *goal/3* atoms of the target subspaces (ids < 0) and target trap spaces (ids >= 0).
+    """
+
+    atoms = []
+    goals = [(-i, s) for i, s in enumerate(target_subspaces, 1)] + list(enumerate(target_trap_spaces))
+    for id_subspace, s in goals:
+        atoms.append(f"subspace({id_subspace})")
+        atoms.extend(f"goal({id_subspace},{asp_name(x)},{1 if v else -1})" for x, v in s.items())
+
+    return atoms
+
+
+def _size_atoms(intervention_type: str, max_size: int = 3) -> List[str]:
+    """
+    Returns the *maxsize/1*, *maxnodes/1* and *maxedges/1* atoms bounding the size and type of the interventions.
+    """
+
+    max_nodes = max_size
+    max_edges = max_size
+    if intervention_type == "node":
+        max_edges = -1
+    if intervention_type == "edge":
+        max_nodes = -1
+
+    return [f"maxsize({max_size})", f"maxnodes({max_nodes})", f"maxedges({max_edges})"]
 
 
 def select_trapspaces(tspaces, subspace: dict, use_attractors: bool = False, tsmin: List[dict] = None, complex_attractors: List[dict] = None):
@@ -212,7 +514,7 @@ def select_trapspaces(tspaces, subspace: dict, use_attractors: bool = False, tsm
     If *use_attractors* is True, it also returns the trap spaces from *tspaces* that contain only elements from *tsmin* and *complex_attractors* that are contained in *subspace*.
     It does not check that the elements of *tsmin* are minimal trap spaces or that the elements of *complex_attractors* are attractors.
     **arguments**:
-        * *tspaces*: list of trap spaces.
+        * *tspaces*: trap spaces, e.g. a list or the generator :func:`iter_trap_spaces`. They are read once.
         * *subspace*: subspace.
         * *use_attractors* (bool): indicates whether attractors are used in the selection of trap spaces or not. Default value: False.
         * *tsmin*: minimal trap spaces. Only used when *use_attractors* is True. Default value: [].
@@ -230,31 +532,34 @@ def select_trapspaces(tspaces, subspace: dict, use_attractors: bool = False, tsm
         complex_attractors = []
 
     # Trap spaces contained in *subspace*
-    sel1 = [x for x in tspaces if is_included_in_subspace(x, subspace)]
-
     if not use_attractors:
-        return sel1
+        return [x for x in tspaces if is_included_in_subspace(x, subspace)]
 
     # Classify minimal trap spaces and complex attractors
     tsmin_accepted = [x for x in tsmin if is_included_in_subspace(x, subspace)]
-    tsmin_discarded = [x for x in tsmin if x not in tsmin_accepted]
+    tsmin_discarded = [x for x in tsmin if not is_included_in_subspace(x, subspace)]
     cattr_accepted = [x for x in complex_attractors if all(is_included_in_subspace(y, subspace) for y in x)]
-    cattr_discarded = [x for x in complex_attractors if x not in cattr_accepted]
+    cattr_discarded = [x for x in complex_attractors if not all(is_included_in_subspace(y, subspace) for y in x)]
 
     # If conditions cannot be matched
     if len(tsmin_accepted) + len(cattr_accepted) == 0:
-        return sel1
+        return [x for x in tspaces if is_included_in_subspace(x, subspace)]
 
     # If all trap spaces satisfy the condition
     if len(tsmin_discarded) + len(cattr_discarded) == 0:
-        return tspaces
-
-    tspaces_left = [x for x in tspaces if x not in sel1]
-    sel2 = [ts for ts in tspaces_left
-            if (any(is_included_in_subspace(x, ts) for x in tsmin_accepted) or
-                any(is_included_in_subspace(y, ts) for x in cattr_accepted for y in x))
-               and not any(is_included_in_subspace(y, ts) for y in tsmin_discarded)
-               and not any(is_included_in_subspace(y, ts) for x in cattr_discarded for y in x)]
+        return list(tspaces)
+
+    # Minimal trap spaces and attractor states that are (not) in *subspace*, indexed by their literals
+    accepted = SubspaceIndex(tsmin_accepted + [y for x in cattr_accepted for y in x])
+    discarded = SubspaceIndex(tsmin_discarded + [y for x in cattr_discarded for y in x])
+
+    # One pass, so that *tspaces* can be a generator
+    sel1, sel2 = [], []
+    for ts in tspaces:
+        if is_included_in_subspace(ts, subspace):
+            sel1.append(ts)
+        elif accepted.any_included_in(ts) and not discarded.any_included_in(ts):
+            sel2.append(ts)
 
     return sel1 + sel2
 
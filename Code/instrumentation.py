@@ -0,0 +1,183 @@
+import bisect, json, logging, os, threading, time
+from contextlib import contextmanager, nullcontext
+from typing import Iterable, Iterator, Optional
+
+log = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds; the last bucket holds everything slower
+BOUNDS = (1e-5, 1e-4, 1e-3, 1e-2, 0.1, 1.0, 10.0)
+LABELS = ("<10us", "<100us", "<1ms", "<10ms", "<100ms", "<1s", "<10s", ">=10s")
+
+# --- Profile ------------------------------------------------------------------
+
+class Profile:
+    """
+    Per-stage call counts, total and largest time and a histogram of durations, plus plain counters.
+    With *trace* every stage is also kept as a complete event ("ph": "X") of the Chrome trace format, at most
+    *max_events* of them. Stages may be recorded from several threads; profiles of worker processes are merged in.
+    """
+
+    def __init__(self, trace: bool = False, max_events: int = 1_000_000):
+        self.stages, self.counters = {}, {}  # name -> [calls, total, max, histogram]; name -> count
+        self.events = [] if trace else None
+        self.max_events, self.dropped = max_events, 0
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start_ns: int, seconds: float, args: dict = None):
+        with self._lock:
+            s = self.stages.get(name)
+            if s is None: s = self.stages[name] = [0, 0.0, 0.0, [0] * len(LABELS)]
+            s[0] += 1; s[1] += seconds; s[2] = max(s[2], seconds)
+            s[3][bisect.bisect_right(BOUNDS, seconds)] += 1
+            if self.events is None: return
+            if len(self.events) >= self.max_events: self.dropped += 1; return
+            event = {"name": name, "ph": "X", "ts": start_ns / 1000, "dur": seconds * 1e6, "pid": os.getpid(), "tid": threading.get_ident()}
+            if args: event["args"] = args
+            self.events.append(event)
+
+    def tally(self, name: str, n: int = 1):
+        with self._lock: self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self, reset: bool = False) -> dict:
+        """Return the profile as a picklable, JSON-serializable dict (and start over if *reset*)."""
+        with self._lock:
+            data = {"stages": {k: [s[0], s[1], s[2], s[3][:]] for k, s in self.stages.items()}, "counters": dict(self.counters),
+                    "events": list(self.events) if self.events is not None else None, "dropped": self.dropped}
+            if reset:
+                self.stages, self.counters, self.dropped = {}, {}, 0
+                if self.events is not None: self.events = []
+        return data
+
+    def merge(self, data: Optional[dict]):
+        """Add a :meth:`snapshot` (e.g. of a worker process) to this profile."""
+        if not data: return
+        with self._lock:
+            for name, (calls, total, peak, hist) in data["stages"].items():
+                s = self.stages.get(name)
+                if s is None: s = self.stages[name] = [0, 0.0, 0.0, [0] * len(LABELS)]
+                s[0] += calls; s[1] += total; s[2] = max(s[2], peak)
+                s[3] = [a + b for a, b in zip(s[3], hist)]
+            for name, n in data["counters"].items(): self.counters[name] = self.counters.get(name, 0) + n
+            self.dropped += data["dropped"]
+            if self.events is not None and data["events"]:
+                room = max(0, self.max_events - len(self.events))
+                self.events.extend(data["events"][:room]); self.dropped += max(0, len(data["events"]) - room)
+
+    def summary(self) -> str:
+        """Return a table of the stages (slowest first) and the counters. Times of all processes and threads are added up."""
+        with self._lock: stages, counters = sorted(self.stages.items(), key=lambda x: -x[1][1]), sorted(self.counters.items())
+        width = max([len(k) for k, _ in stages + counters] + [5])
+        lines = [f"{'stage':{width}} {'calls':>9} {'total s':>10} {'mean ms':>10} {'max ms':>10}  " + " ".join(f"{x:>7}" for x in LABELS)]
+        for name, (calls, total, peak, hist) in stages:
+            lines.append(f"{name:{width}} {calls:9d} {total:10.3f} {1000 * total / calls:10.3f} {1000 * peak:10.3f}  " + " ".join(f"{x:7d}" for x in hist))
+        if counters:
+            lines += ["", f"{'counter':{width}} {'count':>9}"] + [f"{name:{width}} {n:9d}" for name, n in counters]
+        if self.dropped: lines.append(f"({self.dropped} trace events dropped, max_events={self.max_events})")
+        return "\n".join(lines)
+
+    def write_trace(self, path: str):
+        """Write the events as a Chrome trace (chrome://tracing, ui.perfetto.dev, speedscope)."""
+        with self._lock: events = list(self.events or [])
+        names = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "main" if pid == os.getpid() else f"worker {pid}"}}
+                 for pid in sorted({e["pid"] for e in events})]
+        with open(path, "w") as f: json.dump({"traceEvents": names + events, "displayTimeUnit": "ms"}, f)
+        log.info(f"Wrote {len(events)} trace events to {path}")
+
+# --- Global switch ----------------------------------------------------------------
+
+_profile: Optional[Profile] = None
+
+def enable(trace: bool = False) -> Profile:
+    """Start recording into a new profile in this process and return it."""
+    global _profile
+    _profile = Profile(trace)
+    return _profile
+
+def disable() -> Optional[Profile]:
+    """Stop recording; return the profile that was active, if any."""
+    global _profile
+    profile, _profile = _profile, None
+    return profile
+
+def active() -> Optional[Profile]:
+    return _profile
+
+def settings() -> Optional[dict]:
+    """What worker processes need to record like this one (pass to enable(**settings)), or None when disabled."""
+    return None if _profile is None else {"trace": _profile.events is not None}
+
+def drain() -> Optional[dict]:
+    """Return what was recorded since the last drain and clear it (None when disabled); workers ship this with their results."""
+    return None if _profile is None else _profile.snapshot(reset=True)
+
+def merge(data: Optional[dict]):
+    if _profile is not None: _profile.merge(data)
+
+# --- Recording --------------------------------------------------------------------
+
+class _Stage:
+    __slots__ = ("profile", "name", "start")
+
+    def __init__(self, profile, name):
+        self.profile, self.name = profile, name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *exc):
+        self.profile.add(self.name, self.start, (time.perf_counter_ns() - self.start) / 1e9)
+
+_NULL = nullcontext()
+
+def stage(name: str):
+    """Context manager timing the block as stage *name*; a shared no-op when recording is disabled."""
+    return _NULL if _profile is None else _Stage(_profile, name)
+
+def tally(name: str, n: int = 1):
+    """Add *n* to the counter *name*."""
+    if _profile is not None: _profile.tally(name, n)
+
+def stage_iter(name: str, items: Iterable) -> Iterator:
+    """
+    Pass *items* through, timing as stage *name* only the time spent producing them (not the consumer's), as one call
+    per iteration of the whole iterable. The number of items goes to the counter "<name>.items".
+    """
+    profile = _profile
+    if profile is None: yield from items; return
+    it, busy, n, start = iter(items), 0, 0, time.perf_counter_ns()
+    try:
+        while True:
+            t = time.perf_counter_ns()
+            try: item = next(it)
+            except StopIteration: return
+            finally: busy += time.perf_counter_ns() - t
+            n += 1
+            yield item
+    finally:
+        close = getattr(it, "close", None)
+        if close: close()
+        profile.add(name, start, busy / 1e9, {"wall_ms": (time.perf_counter_ns() - start) / 1e6, "items": n})
+        profile.tally(f"{name}.items", n)
+
+@contextmanager
+def profiled(trace: Optional[str] = None, summary: Optional[str] = None, enabled: bool = True):
+    """
+    Record the block (including the worker pools it starts); on exit log the summary and write it to *summary*,
+    and the trace to *trace*, if given. With *enabled* False nothing is recorded and None is yielded.
+
+    **example**::
+        >>> with profiled(trace="profile.json", summary="profile.txt"):
+        ...     compute_control_strategies_with_model_checking_parallel(primes, target, limit=3)
+    """
+    if not enabled:
+        yield None; return
+    profile = enable(trace is not None)
+    try:
+        yield profile
+    finally:
+        disable()
+        text = profile.summary()
+        log.info("Stage timings:\n" + text)
+        if summary:
+            with open(summary, "w") as f: f.write(text + "\n")
+        if trace: profile.write_trace(trace)
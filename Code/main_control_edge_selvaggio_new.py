@@ -1,9 +1,18 @@
+from collections import OrderedDict
+from functools import partial
 from os import system
-from pprint import pformat
 from time import time
 
 from control_strategies_trap_spaces import *
-from control_strategies_parallel import find_common_variables_in_control_strategies,control_direct_percolation,control_model_checking
+from control_strategies_parallel import find_common_variables_in_control_strategies,control_direct_percolation,control_completeness,control_model_checking
+from control_strategies_parallel import prefetch_percolations, dispatch, make_pool, worker_state, get_model_checker
+from control_cache import PercolationCache, freeze, freeze_target, network_hash
+from percolation_engine import engine_for, fix_edges_and_reduce, split_interventions
+from subspaces import SubspaceIndex
+from candidate_pruning import prune_candidates
+from checkpoint import Checkpoint
+from instrumentation import settings, stage
+from result_store import ResultStore
 
 from pyboolnet.trap_spaces import compute_trap_spaces, compute_trapspaces_that_intersect_subspace
 from pyboolnet.file_exchange import bnet2primes
@@ -29,17 +38,125 @@ def list_edges_from_primes(primes: dict, avoid_sources: list = [], avoid_targets
     return edges
 
 
-def fix_edges_and_reduce(primes: dict, interv: dict, keep_vars: list = []):
-    
-    new_primes = primes
+class EdgePercolationCache(PercolationCache):
+    """
+    :class:`PercolationCache` for candidates that mix node interventions (keyed by name) and edge interventions (keyed by (source, target)).
+    The percolation of a candidate is that of its nodes in the edge-reduced network, plus the edges that still matter once the
+    percolation is applied (target not fixed, source not already fixed to the edge value). Candidates with equal percolations
+    have the same reduced network and thus the same verdict.
+    Edge-reduced networks are kept in an LRU of *maxsize* edge sets, and each one is built from the network of its edge
+    prefix, so a shared prefix is reduced once.
+    The keys of *skip* (the common variables, as the enumeration adds them to every candidate) are not applied.
+    """
 
-    for e in interv.keys():
-        new_primes = update_primes(primes=new_primes, name=e[1], constants={e[0]: interv[e]}, copy=True)
-    
-    return new_primes
+    def __init__(self, primes: dict, path: str = None, maxsize: int = 4096, skip: Iterable = ()):
+        super().__init__(primes, path)
+        self.maxsize = maxsize
+        self.reduced = OrderedDict()
+        self.skip = frozenset(skip)
+
+    def interventions(self, cand: dict):
+        """
+        Returns the edge interventions and the node interventions of *cand* that are applied, i.e. without the keys of *skip*.
+        """
+
+        return split_interventions({k: v for k, v in cand.items() if k not in self.skip})
+
+    def reduce_edges(self, edges: dict) -> dict:
+        """
+        Returns *primes* with the edge interventions *edges* applied, see :func:`fix_edges_and_reduce`.
+        """
+
+        key = tuple(sorted(edges.items()))
+        if not key:
+            return self.primes
+        new_primes = self.reduced.get(key)
+        if new_primes is None:
+            new_primes = fix_edges_and_reduce(self.reduce_edges(dict(key[:-1])), dict(key[-1:]))
+            self.reduced[key] = new_primes
+            if len(self.reduced) > self.maxsize:
+                self.reduced.popitem(last=False)
+        self.reduced.move_to_end(key)
+        return new_primes
+
+    def percolate(self, cand: dict) -> dict:
+        edges, nodes = self.interventions(cand)
+        key = freeze({**edges, **nodes})
+        if key not in self.percolations:
+            perc = engine_for(self.reduce_edges(edges)).percolate(nodes)
+            perc.update((e, v) for e, v in edges.items() if e[1] not in perc and perc.get(e[0]) != v)
+            self.percolations[key] = freeze(perc)
+        return dict(self.percolations[key])
+
+    def prefetch(self, cands: List[dict]):
+        groups = {}
+        for cand in cands:
+            edges, nodes = self.interventions(cand)
+            key = freeze({**edges, **nodes})
+            if key not in self.percolations:
+                groups.setdefault(tuple(sorted(edges.items())), []).append((key, nodes))
+        # One batch per edge set, in the network reduced by those edges
+        for edge_key, group in groups.items():
+            engine = engine_for(self.reduce_edges(dict(edge_key)))
+            for (key, _), perc in zip(group, engine.decode_batch(engine.percolate_batch([nodes for _, nodes in group]))):
+                perc.update((e, v) for e, v in edge_key if e[1] not in perc and perc.get(e[0]) != v)
+                self.percolations[key] = freeze(perc)
+
+
+def iter_node_edge_candidates(candidates: list, sizes, common_vars_in_cs: dict, intervention_type: str, values: dict = None):
+    """
+    Yields the candidate interventions of the given *sizes* (without the common variables) in enumeration order.
+    Combinations where a node intervention and an edge intervention target the same node are skipped.
+    *values* gives the values to try for each candidate (default: 0 and 1), see :func:`candidate_pruning.prune_candidates`.
+    """
+
+    if intervention_type == "edge":
+        common = dict(((k,k), common_vars_in_cs[k]) for k in common_vars_in_cs.keys())
+    else:
+        common = common_vars_in_cs
 
+    for i in sizes:
+        for vs in combinations(candidates, i):
+            # Avoid that node intervention and edge intervention target the same node
+            if any(type(y) == tuple and x == y[1] for x in vs for y in vs):
+                continue
+            for ss in product(*([values[x] for x in vs] if values else [(0, 1)]*i)):
+                candidate = dict(zip(vs, ss))
+                candidate.update(common)
+                yield candidate
 
-def compute_control_strategies_with_model_checking_node_and_edge(primes: dict, target: List[dict], method: str, intervention_type: str = "node", update: str = "asynchronous", limit: int = 3, avoid_nodes: List[str] = None, avoid_edges: List[tuple] = None, silent: bool = False, max_output_trapspaces: int = 1000000, starting_length: int = 0, previous_cs: List[dict] = None, known_cs: List[dict] = None):
+
+def check_node_edge_candidate(cache: EdgePercolationCache, candidate: dict, perc: dict, target: List[dict], method: str, update: str):
+    """
+    Decides with *method* whether *candidate* (with percolation *perc* in *cache*) controls *target*.
+    """
+
+    edges, node_intv = cache.interventions(candidate)
+    new_primes = cache.reduce_edges(edges)
+    node_perc = split_interventions(perc)[1]
+
+    if control_direct_percolation(new_primes, node_intv, target, node_perc):
+        return True
+    if method == "completeness":
+        return bool(control_completeness(new_primes, node_intv, target[0], update, perc=node_perc))
+    return bool(control_model_checking(new_primes, node_intv, target, update, perc=node_perc))
+
+
+def _evaluate_node_edge_candidate(candidate: dict, perc: dict, method: str = "model_checking", skip: tuple = ()):
+    """
+    Pool task for :func:`compute_control_strategies_with_model_checking_node_and_edge`, see :func:`_evaluate_candidate`.
+    Each worker keeps its own cache of edge-reduced networks (*skip*: see :class:`EdgePercolationCache`).
+    """
+
+    if "edge_cache" not in worker_state:
+        worker_state["edge_cache"] = EdgePercolationCache(worker_state["primes"], skip=skip)
+    try:
+        return candidate, check_node_edge_candidate(worker_state["edge_cache"], candidate, perc, worker_state["target"], method, worker_state["update"])
+    except Exception as e:
+        return candidate, f"ERROR: {e}"
+
+
+def compute_control_strategies_with_model_checking_node_and_edge(primes: dict, target: List[dict], method: str, intervention_type: str = "node", update: str = "asynchronous", limit: int = 3, avoid_nodes: List[str] = None, avoid_edges: List[tuple] = None, silent: bool = False, max_output_trapspaces: int = 1000000, starting_length: int = 0, previous_cs: List[dict] = None, known_cs: List[dict] = None, checkpoint: str = None, n_jobs: int = 1, window: int = None, cache: EdgePercolationCache = None, query_cache_dir: str = None, prune: str = None, cluster: dict = None):
 
     """
     Identifies control strategies for the *target* subset using model checking.
@@ -54,7 +171,15 @@ def compute_control_strategies_with_model_checking_node_and_edge(primes: dict, t
         * *silent*: if True, does not print infos to screen. Default value: False.
         * *starting_length*: minimum possible size of the control strategies. Default value: 0.
         * *previous_cs*: list of already identified control strategies. Default value: empty list.
+        * *known_cs*: list of known control strategies; candidates with the same percolation are accepted without a check. Default value: empty list.
         * *avoid_nodes*: list of nodes that cannot be part of the control strategies. Default value: empty list.
+        * *checkpoint*: file where the progress is saved periodically. An interrupted run called again with the same file resumes where it stopped. Default value: None.
+        * *n_jobs*: number of worker processes. With 1 the candidates are checked in this process. Default value: 1.
+        * *window*: maximal number of candidates in flight when *n_jobs* > 1. Default value: 4 * *n_jobs*.
+        * *cache*: :class:`EdgePercolationCache` to share percolations and verdicts between runs. Default value: a new in-memory cache.
+        * *query_cache_dir*: directory where the workers share model checking verdicts. Default value: None.
+        * *prune*: "reachability" or "signs" (a lossy heuristic) to remove candidates that cannot help by a static analysis of the interaction graph first, see :func:`candidate_pruning.prune_candidates`. Default value: None.
+        * *cluster*: keyword arguments of :class:`work_queue.ClusterExecutor` (e.g. {"address": ("0.0.0.0", 6000)}) to check the candidates on the worker processes that connect to it instead of a local pool; *n_jobs* is then the number of workers expected. Default value: None.
 
     **returns**:
         * *cs_total*: list of control strategies (dict) of *subspace* obtained using completeness.
@@ -74,18 +199,18 @@ def compute_control_strategies_with_model_checking_node_and_edge(primes: dict, t
         avoid_edges = []
     if known_cs is None:
         known_cs = []
+    if cache is None:
+        cache = EdgePercolationCache(primes)
 
     # Preliminary setting
 
     cs_total = previous_cs
-    perc_true = known_cs
-    perc_false = []
     if type(target) != list:
         print("The target must be a list.")
 
     common_vars_in_cs = find_common_variables_in_control_strategies(primes, target)
     candidate_variables = [x for x in primes.keys() if x not in common_vars_in_cs.keys() and x not in avoid_nodes]
-    candidate_edges = [x for x in list_edges_from_primes(primes, avoid_targets=common_vars_in_cs) if x not in avoid_edges]
+    candidate_edges = sorted(x for x in list_edges_from_primes(primes, avoid_targets=common_vars_in_cs) if x not in avoid_edges)
 
     candidates = candidate_variables
   
@@ -95,52 +220,66 @@ def compute_control_strategies_with_model_checking_node_and_edge(primes: dict, t
         candidate_edges = [x for x in candidate_edges if x[0] != x[1]]
         candidates = candidate_variables + candidate_edges
 
+    # The common variables are part of every strategy but, as in the checks before, are not applied to the network
+    skip = [(k,k) for k in common_vars_in_cs] if intervention_type == "edge" else list(common_vars_in_cs)
+    cache.skip = frozenset(skip)
+
     if not silent:
         print("Number of common variables in the CS:", len(common_vars_in_cs))
         print("Number of candiadate variables:", len(candidates))
 
+    # Known control strategies decide their percolations
 
-    # Computing control strategies
+    for x in known_cs:
+        cache.set_verdict(cache.percolate(x), target, update, method, True)
 
-    for i in range(max(0, starting_length - len(common_vars_in_cs)), limit + 1 - len(common_vars_in_cs)):
+    # Static pruning of the candidates
 
+    sizes = range(max(0, starting_length - len(common_vars_in_cs)), limit + 1 - len(common_vars_in_cs))
+    values = None
+    if prune:
+        values, report = prune_candidates(primes, target, candidates, common_vars_in_cs, prune, sizes)
+        candidates = list(values)
         if not silent:
-            print("Checking control strategies of size", i + len(common_vars_in_cs))
-
-        for vs in combinations(candidates, i):
-            subsets = product(*[(0, 1)]*i)
+            print(report)
 
-            for ss in subsets:
+    # Resuming from a checkpoint, if any
 
-                # Avoid that node intervention and edge intervention target the same node
-                if not any(len(y) == 2 and x == y[1] for x in vs for y in vs):
+    ckpt = Checkpoint(checkpoint, (network_hash(primes), freeze_target(target), method, intervention_type, update,
+                                   tuple(candidates), tuple(sizes), freeze(common_vars_in_cs)) + ((tuple(values.items()),) if values else ()))
+    cs_total = ckpt.restore(cs_total)
+    stream = prefetch_percolations(ckpt.stream(iter_node_edge_candidates(candidates, sizes, common_vars_in_cs, intervention_type, values)), cache)
 
-                    candidate = dict(zip(vs, ss))
-                    if intervention_type == "edge":
-                        candidate.update(dict(((k,k), common_vars_in_cs[k]) for k in common_vars_in_cs.keys()))
-                    else:
-                        candidate.update(common_vars_in_cs)
-
-                    if not any(is_included_in_subspace(candidate, x) for x in cs_total):
-
-                        node_intv = dict((x, candidate[x]) for x in candidate.keys() if x in candidate_variables)
-                        edge_intv = dict((x, candidate[x]) for x in candidate.keys() if x in candidate_edges)
-                            
-                        new_primes = fix_edges_and_reduce(primes=primes, interv=edge_intv, keep_vars=primes.keys())  
-    
-                        if control_direct_percolation(new_primes, node_intv, target):
-                            cs_total.append(candidate)
-
-                        else:
-
-                            if method == "completeness":
-
-                                if control_completeness(new_primes, node_intv, target[0], update):
-                                    cs_total.append(candidate)
-                            else:
+    # Computing control strategies
 
-                                if control_model_checking(new_primes, node_intv, target, update):
-                                    cs_total.append(candidate)
+    if not silent:
+        print("Checking control strategies of size", starting_length, "to", limit)
+
+    if n_jobs > 1 or cluster:
+        evaluate = partial(_evaluate_node_edge_candidate, method=method, skip=tuple(skip))
+        with make_pool(n_jobs, (primes, target, update, query_cache_dir, settings(), get_model_checker()), cluster) as exe:
+            dispatch(exe, cache, target, update, stream, cs_total, window or 4 * n_jobs, ckpt, method, evaluate)
+    else:
+        found = SubspaceIndex(cs_total)
+        for index, candidate in stream:
+
+            if not found.has_superspace(candidate):
+
+                perc = cache.percolate(candidate)
+                verdict = cache.verdict(perc, target, update, method)
+                if verdict is None:
+                    with stage("check"):
+                        verdict = check_node_edge_candidate(cache, candidate, perc, target, method, update)
+                    cache.set_verdict(perc, target, update, method, verdict)
+                if verdict:
+                    cs_total.append(candidate)
+                    found.add(candidate)
+
+            ckpt.resolve(index)
+            ckpt.tick(cs_total)
+
+    ckpt.save(cs_total)
+    cache.save()
 
     return cs_total
 
@@ -173,7 +312,6 @@ if __name__ == "__main__":
     limit = 2
     avoid_pheno_nodes = True
     intervention_type = "combined" #options: node, edge, combined
-    output_file = "Results/" + network + "_lim" + str(limit) + "_" + intervention_type + "_model_checking_avoid_hybrid"
     target = [
         {'AJ_b1': 0, 'AJ_b2': 0, 'FA_b1': 0, 'FA_b2': 0, 'FA_b3': 0},
         {'AJ_b1': 0, 'AJ_b2': 0, 'FA_b1': 0, 'FA_b2': 0, 'FA_b3': 1},
@@ -210,8 +348,7 @@ if __name__ == "__main__":
         avoid_edges=avoid_edges)
 
 
-    with open(output_file+".py", "w") as f:
-        f.write("targets = " + pformat(target) + "\n")
-        f.write("#Control strategies" + "\ncs = " + pformat(cs) + "\n")
+    with ResultStore("Results/store").table(primes, target, intervention_type + "-model_checking_avoid_hybrid", limit) as table:
+        table.extend(cs)
 
 
@@ -8,7 +8,8 @@ Created on Fri Nov 21 14:47:00 2025
 
 
 from pyboolnet.repository import get_primes
-from control_strategies_trap_spaces import run_control_problem, results_info
+from control_strategies_trap_spaces import run_control_problems, results_info
+from result_store import ResultStore
 from itertools import product
 
 if __name__ == "__main__":
@@ -30,35 +31,36 @@ if __name__ == "__main__":
                   ("EGF","EGFR"),("ECM","ITG_AB"),("HGF","HGFR"),("RPTP_L","RPTP"),("WNT","C4K1")]
    
    variables = list(primes)   
-   for phenotype in targets:
+   intervention_type = "combined"  # Options: "node", "edge", "combined"
+   limit = 3
 
-       intervention_type = "combined"  # Options: "node", "edge", "combined"
-       control_type = "percolation"  # Options: "percolation","trap_spaces", "both"
-       update = "asynchronous"
-       target = targets[phenotype]
-       print("TARGET", targets[phenotype])
-       avoid_nodes = list(target)
-       avoid_edges = [e for e in product(variables, variables) if (e[0] == e[1]) or (e[0] in avoid_nodes) or (e[1] in avoid_nodes)]
-       limit = 3
-       use_attractors = True
-       complex_attractors = []
-       output_file = f"control_results/traps-spaces-{phenotype}-{intervention_type}-{control_type}"
+   avoid_nodes = list(targets["E1"])
+   avoid_edges = [e for e in product(variables, variables) if (e[0] == e[1]) or (e[0] in avoid_nodes) or (e[1] in avoid_nodes)]
+   # One table per phenotype, appended to while clingo runs; reload with store.table(...).load(size=..., involves=[...])
+   store = ResultStore("control_results/store")
 
-       print(f"Phenotype: {phenotype}, Type: {intervention_type} -{control_type}")
+   control_type = "percolation"  # Options: "percolation","trap_spaces", "both"
+   use_attractors = True
+   complex_attractors = []
+
+   # All phenotypes fix the same AJ/FA nodes: the network is grounded once and the minimal trap spaces are computed once for all of them
+   cs_by_phenotype = run_control_problems(
+       primes=primes,
+       targets=targets,
+       intervention_type=intervention_type,
+       control_type=control_type,
+       avoid_nodes=avoid_nodes,
+       avoid_edges=avoid_edges,
+       limit=limit,
+       store=store,
+       use_attractors=use_attractors,
+       complex_attractors=complex_attractors)
 
-       cs = run_control_problem(
-           primes=primes,
-           target=target,
-           intervention_type=intervention_type,
-           control_type=control_type,
-           avoid_nodes=avoid_nodes,
-           avoid_edges=avoid_edges,
-           limit=limit,
-           output_file=output_file,
-           use_attractors=use_attractors,
-           complex_attractors=complex_attractors)
+   for phenotype, cs in cs_by_phenotype.items():
 
+       print(f"Phenotype: {phenotype}, Type: {intervention_type} -{control_type}")
+       print("TARGET", targets[phenotype])
        print(results_info(cs))
        
        cs2 = [strat for strat in cs if len(strat) == 2]
-       print(cs2)
\ No newline at end of file
+       print(cs2)
@@ -6,10 +6,11 @@ Created on Wed Nov  5 15:09:24 2025
 @author: frederik
 """
 import os
-from control_strategies_parallel import compute_control_strategies_with_model_checking_parallel
+from control_strategies_parallel import compute_control_strategies_for_targets
+from control_cache import PercolationCache
+from instrumentation import profiled
 from pyboolnet.repository import get_primes
-import json
-import pickle
+from result_store import ResultStore
 from pathlib import Path
 
 output_dir = Path("control_results")
@@ -34,59 +35,51 @@ AVOID_H = [{"AJ_b1": 0, "AJ_b2": 0}, {"FA_b1": 0,"FA_b2": 0, "FA_b3": 0}]
 if __name__ == "__main__":
 
     network = "selvaggio_emt"  # "grieco_mapk" # "selvaggio_emt"
-    target = AVOID_H
+    targets = {"AVOID_H": AVOID_H}
+
+    # Set to True to also control the eight phenotypes in the same run: all targets fix the same AJ/FA nodes, so each
+    # candidate is percolated, reduced and its trap spaces computed once and classified against all of them in one pass
+    all_phenotypes = False
+    if all_phenotypes:
+        targets.update({"E1": E1, "H1": H1, "H2": H2, "H3": H3, "M1": M1, "M2": M2, "M3": M3, "UN": UN})
 
     update = "asynchronous"
     lower_limit = 0
     limit = 2
 
     primes = get_primes(network)
-
-    control_strategies = compute_control_strategies_with_model_checking_parallel(
-        primes=primes,
-        target=target,
-        update=update,
-        limit=limit,
-        start=lower_limit,
-        known=[],
-        avoid=['AJ_b1','AJ_b2','FA_b1','FA_b2','FA_b3'],
-        n_jobs=os.cpu_count() - 2
-    )
-
-    cs1 = [cs for cs in control_strategies if len(cs) == 1]
-    cs2 = [cs for cs in control_strategies if len(cs) == 2]
-    #cs3 = [cs for cs in control_strategies if len(cs) == 3]
-    #cs4 = [cs for cs in control_strategies if len(cs) == 4]
-    
-    print("Number of size 1 control strategies:", len(cs1))
-    print("Number of size 2 control strategies:", len(cs2))
-    #print("Number of size 3 control strategies:", len(cs3))
-    #print("Number of size 4 control strategies:", len(cs4))
-    
-    
-    
-    """
-    # Save intermediate results as JSON
-    filename = output_dir / f"{network}_phenotype_6.json"
-    with open(filename, "w") as f:
-        json.dump({"cs2": cs2, "cs3": cs3}, f, indent=2)
-
-    # Optionally also pickle (faster to reload)
-    filename_pickle = output_dir / f"{network}_phenotype_6.pkl"
-    with open(filename_pickle, "wb") as f:
-        pickle.dump({"cs2": cs2, "cs3": cs3, "cs4": cs4}, f)
-    """
-"""
-import json
-
-filename = "control_results/selvaggio_emt_phenotype_0.json"
-
-with open(filename, "r") as f:
-    data = json.load(f)
-
-cs2 = data["cs2"]
-cs3 = data["cs3"]
-
-print("Loaded cs2:", cs2)
-print("Number of cs2 strategies:", len(cs2))
-"""
\ No newline at end of file
+    # Percolations and verdicts are reused when re-running
+    cache = PercolationCache(primes, path=str(output_dir / f"{network}_percolation_cache.pkl"))
+
+    # Per-stage timings (percolation, trap spaces, reduction, NuSMV), written next to the results;
+    # the trace opens in ui.perfetto.dev or chrome://tracing
+    profile = False
+    with profiled(trace=str(output_dir / f"{network}_profile.trace.json"), summary=str(output_dir / f"{network}_profile.txt"), enabled=profile):
+        control_strategies_by_target = compute_control_strategies_for_targets(
+            primes=primes,
+            targets=targets,
+            update=update,
+            limit=limit,
+            start=lower_limit,
+            avoid=['AJ_b1','AJ_b2','FA_b1','FA_b2','FA_b3'],
+            n_jobs=os.cpu_count() - 2,
+            cache=cache
+        )
+
+    # Stored as bitset tables keyed by (network, target, method, limit); reload without parsing everything, e.g.
+    # store.table(primes, M3, "node-model_checking", limit).load(size=2, involves=["ITG_AB"])
+    store = ResultStore(str(output_dir / "store"))
+
+    for name, control_strategies in control_strategies_by_target.items():
+
+        cs1 = [cs for cs in control_strategies if len(cs) == 1]
+        cs2 = [cs for cs in control_strategies if len(cs) == 2]
+        #cs3 = [cs for cs in control_strategies if len(cs) == 3]
+
+        print(f"Target {name}")
+        print("Number of size 1 control strategies:", len(cs1))
+        print("Number of size 2 control strategies:", len(cs2))
+        #print("Number of size 3 control strategies:", len(cs3))
+
+        with store.table(primes, targets[name], "node-model_checking", limit) as table:
+            print("Stored", table.extend(control_strategies), "new control strategies in", table.path)
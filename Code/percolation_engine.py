@@ -0,0 +1,238 @@
+import logging
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+log = logging.getLogger(__name__)
+
+# --- Compiled percolation -----------------------------------------------------
+
+class PercolationEngine:
+    """
+    Prime implicants compiled once into integer bitmask clause tables.
+    A subspace is a pair of ints (fixed, values): bit i of *fixed* says that
+    variable i is constant, bit i of *values* gives its value. Percolation is a
+    worklist constant propagation over these masks, without copying *primes*.
+    Results agree with pyboolnet's find_constants(percolate(...)).
+    """
+
+    max_restricted = 1 << 18  # size of the memo of restricted functions of reduce, cleared when full
+
+    def __init__(self, primes: dict):
+        self.primes = primes
+        self.names = list(primes)
+        self.index = {v: i for i, v in enumerate(self.names)}
+        # clauses[i]: [(value, mask, bits)] for every prime implicant of variable i
+        self.clauses = [[(val, *self.encode(p)) for val in (0, 1) for p in primes[v][val]] for v in self.names]
+        succ = [set() for _ in self.names]
+        for i, v in enumerate(self.names):
+            for val in (0, 1):
+                for p in primes[v][val]:
+                    for u in p: succ[self.index[u]].add(i)
+        self.successors = [sorted(s) for s in succ]
+        self.regulators = [0] * len(self.names)  # regulators[i]: mask of the variables in the clauses of variable i
+        for i, clauses in enumerate(self.clauses):
+            for _, mask, _ in clauses: self.regulators[i] |= mask
+        self.base = self._propagate(0, 0, list(range(len(self.names))))
+        self._tables = None  # compiled by percolate_batch on first use
+        self._restricted = {}  # (i, fixed & regulators[i], values & regulators[i]) -> restricted implicants of variable i
+
+    def encode(self, sub: dict) -> Tuple[int, int]:
+        """Return the (fixed, values) masks of a subspace."""
+        fixed = values = 0
+        for v, x in sub.items():
+            bit = 1 << self.index[v]
+            fixed |= bit
+            if x: values |= bit
+        return fixed, values
+
+    def decode(self, fixed: int, values: int) -> Dict[str, int]:
+        """Return the subspace dict of (fixed, values), in *primes* order."""
+        return {v: (values >> i) & 1 for i, v in enumerate(self.names) if (fixed >> i) & 1}
+
+    def _propagate(self, fixed: int, values: int, work: List[int]) -> Tuple[int, int]:
+        clauses, successors = self.clauses, self.successors
+        while work:
+            i = work.pop()
+            bit = 1 << i
+            if fixed & bit: continue
+            for val, mask, bits in clauses[i]:
+                if fixed & mask == mask and values & mask == bits:
+                    fixed |= bit
+                    if val: values |= bit
+                    work.extend(successors[i])
+                    break
+        return fixed, values
+
+    def extend(self, state: Tuple[int, int], sub: dict) -> Tuple[int, int]:
+        """
+        Percolate *sub* on top of the percolated subspace *state*.
+        Only valid if *state* is a fixed point of a subset of the final constants,
+        i.e. *sub* does not override a value already fixed in *state*.
+        """
+        fixed, values = state
+        add_fixed, add_values = self.encode(sub)
+        if (values ^ add_values) & fixed & add_fixed:
+            raise ValueError("sub contradicts the percolated state")
+        work = [j for v in sub for j in self.successors[self.index[v]]]
+        return self._propagate(fixed | add_fixed, values | add_values, work)
+
+    def state(self, cand: dict) -> Tuple[int, int]:
+        """Return the percolated (fixed, values) of the network with *cand* added as constants."""
+        try: return self.extend(self.base, cand)
+        except ValueError:  # cand overrides a constant of the network: percolate from scratch
+            add_fixed, add_values = self.encode(cand)
+            return self._propagate(add_fixed, add_values, list(range(len(self.names))))
+
+    def percolate(self, cand: dict) -> Dict[str, int]:
+        """Drop-in for find_constants(percolate(primes, add_constants=cand, copy=True))."""
+        return self.decode(*self.state(cand))
+
+    def reduce(self, sub: dict, keep: List[str] = ()) -> dict:
+        """
+        Drop-in for fix_components_and_reduce: percolate *sub* and remove constants not in *keep*.
+        A restricted function depends only on the constants among the regulators of its variable, so it is memoized
+        on them: candidates that share a prefix (or just a neighbourhood) share the restrictions of everything their
+        prefix percolates to, and each reduction only restricts the functions around what is new. The implicant lists
+        are shared between reductions and must not be changed in place.
+        """
+        fixed, values = self.state(sub)
+        memo, regulators = self._restricted, self.regulators
+        if len(memo) >= self.max_restricted: memo.clear()
+        out = {}
+        for i, v in enumerate(self.names):
+            bit = 1 << i
+            if fixed & bit:
+                if v in keep: out[v] = [[], [{}]] if values & bit else [[{}], []]
+                continue
+            mask = regulators[i]
+            key = (i, fixed & mask, values & mask)
+            functions = memo.get(key)
+            if functions is None:
+                functions = memo[key] = [_restrict(self.primes[v][val], self.index, fixed, values) for val in (0, 1)]
+            out[v] = functions[:]
+        return out
+
+    # --- Batches ---------------------------------------------------------------
+
+    def percolate_batch(self, cands: List[dict], chunk: int = 1 << 14) -> np.ndarray:
+        """
+        Percolate many candidates at once; returns an N x V int8 matrix (columns in *names* order,
+        0/1 for constants, -1 for free variables). Row n agrees with state(cands[n]).
+        The batch is bit-sliced: each variable is a row of uint64 words holding one bit per
+        candidate, so a synchronous propagation step is a handful of word-wide numpy operations.
+        """
+        out = np.empty((len(cands), len(self.names)), np.int8)
+        for start in range(0, len(cands), chunk):
+            block = cands[start:start + chunk]
+            out[start:start + len(block)] = self._percolate_block(block)
+        return out
+
+    def _percolate_block(self, cands: List[dict]) -> np.ndarray:
+        n, nv = len(cands), len(self.names)
+        if self._tables is None: self._tables = self._compile_batch()
+        by_size, n_clauses, heads, starts = self._tables
+        fixed, values = np.zeros((n, nv), bool), np.zeros((n, nv), bool)
+        rows = [r for r, cand in enumerate(cands) for _ in cand]
+        cols = [self.index[v] for cand in cands for v in cand]
+        fixed[rows, cols] = True
+        values[rows, cols] = [bool(x) for cand in cands for x in cand.values()]
+        f, x = _slice(fixed), _slice(values)
+        sat = np.empty((n_clauses, f.shape[1]), np.uint64)
+        hits = np.zeros((2 * nv, f.shape[1]), np.uint64)
+        while True:
+            lits = np.concatenate((f & ~x, f & x))  # row u + V*value: "u is fixed to value"
+            for size, (ids, clause_lits) in by_size.items():
+                sat[ids] = np.bitwise_and.reduce(lits[clause_lits], axis=1) if size else ~np.uint64(0)
+            if n_clauses: hits[heads] = np.bitwise_or.reduceat(sat, starts, axis=0)
+            new0, new1 = hits[:nv] & ~f, hits[nv:] & ~f
+            if not (new0 | new1).any(): break
+            f |= new0 | new1
+            x |= new1
+        fixed, values = _unslice(f, n), _unslice(x, n)
+        return np.where(fixed, values.astype(np.int8), np.int8(-1))
+
+    def _compile_batch(self):
+        """Clause tables for percolate_batch: clauses sorted by head (variable + V*value) and grouped by size."""
+        nv = len(self.names)
+        clauses = sorted(((val * nv + i, [self.index[u] + nv * x for u, x in p.items()])
+                          for i, v in enumerate(self.names) for val in (0, 1) for p in self.primes[v][val]), key=lambda c: c[0])
+        heads = np.array([h for h, _ in clauses], dtype=np.intp)
+        starts = np.flatnonzero(np.r_[True, heads[1:] != heads[:-1]]) if clauses else np.zeros(0, np.intp)
+        grouped = {}
+        for c, (_, lits) in enumerate(clauses): grouped.setdefault(len(lits), []).append((c, lits))
+        by_size = {k: (np.array([c for c, _ in g]), np.array([l for _, l in g], dtype=np.intp).reshape(len(g), k)) for k, g in grouped.items()}
+        return by_size, len(clauses), heads[starts], starts
+
+    def decode_batch(self, matrix: np.ndarray) -> List[Dict[str, int]]:
+        """Return the subspace dicts of the rows of a percolate_batch matrix."""
+        names = self.names
+        return [{names[j]: int(row[j]) for j in np.flatnonzero(row >= 0)} for row in matrix]
+
+    def contained(self, matrix: np.ndarray, subspaces: List[dict]) -> np.ndarray:
+        """Boolean mask of the rows of a percolate_batch matrix that lie in one of *subspaces*."""
+        mask = np.zeros(len(matrix), bool)
+        for sub in subspaces:
+            cols = [self.index[v] for v in sub]
+            mask |= (matrix[:, cols] == np.array(list(sub.values()), np.int8)).all(axis=1)
+        return mask
+
+    def restrict(self, implicants: List[dict], sub: dict) -> List[dict]:
+        """Prime implicants of a function (given by *implicants*) with the variables of *sub* fixed."""
+        return _restrict(implicants, self.index, *self.encode(sub))
+
+def _slice(matrix: np.ndarray) -> np.ndarray:
+    """N x V bool matrix -> V x ceil(N/64) uint64 words, bit n of row v being matrix[n, v]."""
+    packed = np.packbits(matrix, axis=0, bitorder="little")
+    packed = np.pad(packed, ((0, -len(packed) % 8), (0, 0)))
+    return np.ascontiguousarray(packed.T).view(np.uint64)
+
+def _unslice(words: np.ndarray, n: int) -> np.ndarray:
+    """Inverse of _slice for a batch of *n* rows."""
+    return np.unpackbits(words.view(np.uint8), axis=1, count=n, bitorder="little").T.astype(bool)
+
+def _restrict(implicants: List[dict], index: dict, fixed: int, values: int) -> List[dict]:
+    """Prime implicants of a function restricted to a subspace: restricted implicants, minus absorbed ones."""
+    rest = []
+    for p in implicants:
+        lits = [(u, x) for u, x in p.items() if not (fixed >> index[u]) & 1]
+        if all(((values >> index[u]) & 1) == x for u, x in p.items() if (fixed >> index[u]) & 1):
+            rest.append(dict(lits))
+    rest.sort(key=len)
+    out = []
+    for p in rest:
+        if not any(q.items() <= p.items() for q in out): out.append(p)
+    return out
+
+# --- Engine lookup --------------------------------------------------------------
+
+_engines = OrderedDict()
+
+def engine_for(primes: dict, size: int = 16) -> PercolationEngine:
+    """Return a (cached) engine for *primes*; *primes* must not be mutated afterwards."""
+    key = id(primes)
+    engine = _engines.get(key)
+    if engine is None or engine.primes is not primes:
+        engine = _engines[key] = PercolationEngine(primes)
+        if len(_engines) > size: _engines.popitem(last=False)
+    _engines.move_to_end(key)
+    return engine
+
+# --- Edge interventions ---------------------------------------------------------
+
+def split_interventions(cand: dict) -> Tuple[dict, dict]:
+    """The edge interventions (keyed by (source, target)) and the node interventions of *cand*, as two dicts."""
+    edges = {x: v for x, v in cand.items() if type(x) == tuple}
+    nodes = {x: v for x, v in cand.items() if type(x) != tuple}
+    return edges, nodes
+
+def fix_edges_and_reduce(primes: dict, interv: dict, keep_vars: list = []) -> dict:
+    """
+    *primes* with the edge interventions *interv* applied: for every edge (i,j) with value v, i is replaced by v in
+    the function of j. Only the functions of the targeted nodes are copied, the others are shared with *primes*.
+    """
+    new_primes = dict(primes)
+    engine = engine_for(primes)
+    for (i, j), v in interv.items():
+        new_primes[j] = [engine.restrict(new_primes[j][k], {i: v}) for k in (0, 1)]
+    return new_primes
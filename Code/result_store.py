@@ -0,0 +1,234 @@
+import hashlib, json, logging, os
+import numpy as np
+from typing import Dict, Iterable, Iterator, List, Optional
+from control_cache import freeze_target, network_hash
+
+log = logging.getLogger(__name__)
+
+META, ROWS, SIZES = "meta.json", "rows.bin", "sizes.bin"
+
+# --- Intervention vocabulary ------------------------------------------------------
+
+def interventions_of(primes: dict) -> list:
+    """
+    Return every intervention key of *primes*: the nodes in primes order, then the edges (source, target) sorted.
+    (k, k) is listed for every node k, also without a self-loop, since edge-only searches key common variables that way.
+    """
+    edges = {(u, v) for v in primes for k in (0, 1) for p in primes[v][k] for u in p} | {(k, k) for k in primes}
+    return list(primes) + sorted(edges)
+
+def _key_to_json(key):
+    return list(key) if isinstance(key, tuple) else key
+
+def _key_from_json(key):
+    return tuple(key) if isinstance(key, list) else key
+
+def read_json_results(path: str) -> List[dict]:
+    """
+    Return the strategies of a JSON results file such as the ones in "EMT control results", flattening the nested
+    groups ({"cs2": [...]} or {"cs3": {"n1_e2": [...]}}). Edge keys written as "source|target" become (source, target).
+    """
+    with open(path) as f: data = json.load(f)
+    def flatten(x):
+        if isinstance(x, list):
+            for y in x: yield from flatten(y)
+        elif all(isinstance(y, int) for y in x.values()):
+            yield {tuple(k.split("|")) if "|" in k else k: v for k, v in x.items()}
+        else:
+            for y in x.values(): yield from flatten(y)
+    return list(flatten(data))
+
+# --- Result tables ------------------------------------------------------------------
+
+class ResultTable:
+    """
+    Control strategies of one search as a memory-mapped bitset table in the directory *path*.
+    Every strategy is a row of 2*W uint64 words in rows.bin: the bitmask of the interventions it fixes, then the bitmask
+    of their values, with bit i standing for key i of the vocabulary in meta.json (nodes and edges of the network).
+    sizes.bin holds the size of every row as one byte, so size filters read one byte per strategy.
+    Rows are appended as strategies are found and are readable at any time: readers only see the rows complete in both
+    files, and a partial row left by an interrupted write is cut off before the first append. Decoded strategies list
+    their keys in vocabulary order.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META)) as f: self.meta = json.load(f)
+        self.keys = [_key_from_json(k) for k in self.meta["keys"]]
+        self.bits = {k: i for i, k in enumerate(self.keys)}
+        self.words = (len(self.keys) + 63) // 64
+        self._seen, self._out = None, None
+
+    @classmethod
+    def create(cls, path: str, meta: dict) -> "ResultTable":
+        os.makedirs(path, exist_ok=True)
+        tmp = os.path.join(path, f"{META}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f: json.dump(meta, f)
+        os.replace(tmp, os.path.join(path, META))
+        return cls(path)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _repair(self):
+        """Cut rows.bin and sizes.bin to the number of complete rows present in both (only by the writer, before appending)."""
+        n = len(self)
+        for name, width in ((ROWS, 16 * self.words), (SIZES, 1)):
+            if os.path.exists(self._file(name)) and os.path.getsize(self._file(name)) != n * width:
+                log.warning(f"Dropping a partial row of {self._file(name)}")
+                os.truncate(self._file(name), n * width)
+
+    def __len__(self):
+        sizes = [os.path.getsize(self._file(name)) // width if os.path.exists(self._file(name)) else 0
+                 for name, width in ((ROWS, 16 * self.words), (SIZES, 1))]
+        return min(sizes)
+
+    # --- Writing ---
+
+    def encode(self, strategy: dict) -> np.ndarray:
+        row = np.zeros(2 * self.words, np.uint64)
+        for key, value in strategy.items():
+            if key not in self.bits: raise ValueError(f"{key} is not a node or edge of the network of {self.path}.")
+            word, bit = divmod(self.bits[key], 64)
+            row[word] |= np.uint64(1 << bit)
+            if value: row[self.words + word] |= np.uint64(1 << bit)
+        return row
+
+    def append(self, strategy: dict) -> bool:
+        """Append *strategy* unless it is stored already; return whether it was added."""
+        return self.extend([strategy]) == 1
+
+    def extend(self, strategies: Iterable[dict]) -> int:
+        """Append the strategies that are not stored yet and flush; return how many were added."""
+        if self._seen is None: self._seen = {row.tobytes() for row in self.rows()}
+        rows, sizes = [], []
+        for strategy in strategies:
+            row = self.encode(strategy).tobytes()
+            if row in self._seen: continue
+            self._seen.add(row); rows.append(row); sizes.append(len(strategy))
+        if not rows: return 0
+        if self._out is None:
+            self._repair()
+            self._out = open(self._file(ROWS), "ab"), open(self._file(SIZES), "ab")
+        self._out[0].write(b"".join(rows)); self._out[1].write(bytes(sizes))
+        for f in self._out: f.flush()
+        return len(rows)
+
+    def close(self):
+        if self._out is not None:
+            for f in self._out: f.close()
+            self._out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Reading ---
+
+    def rows(self) -> np.ndarray:
+        """The table as an (N, 2*W) uint64 array, memory-mapped (nothing is read until it is used)."""
+        n = len(self)
+        if n == 0: return np.zeros((0, 2 * self.words), np.uint64)
+        return np.memmap(self._file(ROWS), np.uint64, "r", shape=(n, 2 * self.words))
+
+    def sizes(self) -> np.ndarray:
+        n = len(self)
+        if n == 0: return np.zeros(0, np.uint8)
+        return np.memmap(self._file(SIZES), np.uint8, "r", shape=(n,))
+
+    def mask(self, size: int = None, min_size: int = None, max_size: int = None,
+             contains: dict = None, involves: Iterable = None, avoids: Iterable = None) -> np.ndarray:
+        """
+        Boolean array over the rows: strategies of *size* (or between *min_size* and *max_size*) that include every
+        intervention of *contains*, fix every key of *involves* (to any value) and none of *avoids*.
+        Only the words of the keys asked for are read.
+        """
+        sizes = self.sizes()
+        keep = np.ones(len(sizes), bool)
+        if size is not None: keep &= sizes == size
+        if min_size is not None: keep &= sizes >= min_size
+        if max_size is not None: keep &= sizes <= max_size
+        rows = self.rows()
+        def column(key, offset=0):
+            if key not in self.bits: return None
+            word, bit = divmod(self.bits[key], 64)
+            return rows[:, offset + word] & np.uint64(1 << bit) != 0
+        for key, value in (contains or {}).items():
+            fixed = column(key)
+            if fixed is None: return np.zeros(len(sizes), bool)
+            keep &= fixed & (column(key, self.words) == bool(value))
+        for key in involves or ():
+            fixed = column(key)
+            if fixed is None: return np.zeros(len(sizes), bool)
+            keep &= fixed
+        for key in avoids or ():
+            fixed = column(key)
+            if fixed is not None: keep &= ~fixed
+        return keep
+
+    def decode(self, row: np.ndarray) -> dict:
+        fixed, values = row[:self.words].tolist(), row[self.words:].tolist()
+        strategy = {}
+        for word in range(self.words):
+            bits = fixed[word]
+            while bits:
+                low = bits & -bits
+                i = low.bit_length() - 1
+                strategy[self.keys[64 * word + i]] = int(values[word] & low != 0)
+                bits ^= low
+        return strategy
+
+    def load(self, **filters) -> List[dict]:
+        """Decode the strategies selected by *filters* (see :meth:`mask`), in the order they were stored."""
+        rows = self.rows()
+        if filters: rows = rows[self.mask(**filters)]
+        return [self.decode(row) for row in rows]
+
+    def __iter__(self) -> Iterator[dict]:
+        rows = self.rows()
+        for start in range(0, len(rows), 4096):
+            for row in np.asarray(rows[start:start + 4096]): yield self.decode(row)
+
+# --- Result store -------------------------------------------------------------------
+
+class ResultStore:
+    """
+    A directory of :class:`ResultTable`, one per search keyed by (network hash, target, method, limit).
+    *method* names the enumeration, e.g. "node-model_checking" or "combined-percolation". Tables are created on first
+    use, so several scripts (and later runs) can append to the same store.
+
+    **example**::
+        >>> store = ResultStore("control_results/store")
+        >>> table = store.table(primes, target, "node-model_checking", 2)
+        >>> table.extend(control_strategies)
+        >>> table.load(size=2, involves=["ITG_AB"])
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(network: str, target, method: str, limit: int) -> str:
+        return hashlib.sha1(f"{network}|{freeze_target(target)!r}|{method}|{limit}".encode()).hexdigest()
+
+    def table(self, primes: dict, target, method: str, limit: int) -> ResultTable:
+        """Return the table of the given search, creating it if it does not exist yet."""
+        network = network_hash(primes)
+        path = os.path.join(self.root, self.key(network, target, method, limit))
+        if os.path.exists(os.path.join(path, META)): return ResultTable(path)
+        meta = {"network": network, "target": target, "method": method, "limit": limit,
+                "keys": [_key_to_json(k) for k in interventions_of(primes)]}
+        return ResultTable.create(path, meta)
+
+    def tables(self, network: Optional[str] = None, method: Optional[str] = None, limit: Optional[int] = None) -> Iterator[ResultTable]:
+        """Yield the stored tables, optionally only those of one network hash, method or limit."""
+        for name in sorted(os.listdir(self.root)):
+            if not os.path.exists(os.path.join(self.root, name, META)): continue
+            table = ResultTable(os.path.join(self.root, name))
+            meta = table.meta
+            if (network is None or meta["network"] == network) and (method is None or meta["method"] == method) \
+                    and (limit is None or meta["limit"] == limit):
+                yield table
@@ -0,0 +1,229 @@
+import argparse, ast, json, logging, os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from typing import Iterable, Iterator, List, Optional, TextIO, Tuple
+from pyboolnet.file_exchange import bnet2primes
+from pyboolnet.repository import get_primes
+from pyboolnet.trap_spaces import compute_steady_states
+from percolation_engine import engine_for, fix_edges_and_reduce, split_interventions
+from result_store import ResultTable
+from subspaces import SubspaceIndex
+
+log = logging.getLogger(__name__)
+
+SEPARATOR = "=" * 80
+
+
+# --- Steady states of a control strategy -------------------------------------------
+
+def steady_states_of_strategy(primes: dict, strategy: dict, include: List[dict] = None, exclude: List[dict] = None, max_output: int = 1000000) -> List[dict]:
+    """
+    Computes the steady states of *primes* under the control strategy *strategy* (node interventions keyed by name,
+    edge interventions keyed by (source, target)), keeping those that lie in some subspace of *include* and in no subspace of *exclude*.
+    The strategy is percolated first, so the steady states are computed (in one clingo run) for the reduced network only.
+
+    **arguments**:
+        * *primes*: prime implicants.
+        * *strategy*: control strategy.
+        * *include*: list of subspaces. If given, only steady states in one of them are returned. Default value: None.
+        * *exclude*: list of subspaces. Steady states in one of them are not returned. Default value: None.
+        * *max_output*: maximal number of steady states of the reduced network. Default value: 1000000.
+    **returns**:
+        * *states* (list): matching steady states (full states of *primes*).
+    **example**::
+        >>> steady_states_of_strategy(primes, {'JNK': 1, 'AKT': 1}, exclude=phenotypes)
+    """
+
+    edges, nodes = split_interventions(strategy)
+    new_primes = fix_edges_and_reduce(primes, edges) if edges else primes
+    engine = engine_for(new_primes)
+    constants = engine.percolate(nodes)
+    reduced = engine.reduce(nodes)
+    states = compute_steady_states(reduced, max_output=max_output) if reduced else [{}]
+
+    inside = SubspaceIndex(include or [])
+    outside = SubspaceIndex(exclude or [])
+    matching = []
+    for x in states:
+        state = {v: x[v] if v in x else constants[v] for v in primes}
+        if (include is None or inside.has_superspace(state)) and not outside.has_superspace(state):
+            matching.append(state)
+    return matching
+
+
+def iter_steady_states(primes: dict, strategies: Iterable[dict], include: List[dict] = None, exclude: List[dict] = None, n_jobs: int = 1, max_output: int = 1000000) -> Iterator[Tuple[dict, List[dict]]]:
+    """
+    Yields (strategy, matching steady states) for every strategy of *strategies*, in order (see :func:`steady_states_of_strategy`).
+    With *n_jobs* > 1 the strategies are distributed over a process pool; the network is sent to each worker once.
+    """
+
+    if n_jobs <= 1:
+        for strategy in strategies:
+            yield strategy, steady_states_of_strategy(primes, strategy, include, exclude, max_output)
+        return
+
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_steady_state_worker, initargs=(primes, include, exclude, max_output)) as exe:
+        yield from exe.map(_steady_states_task, strategies)
+
+
+_worker = {}
+
+
+def init_steady_state_worker(primes: dict, include: List[dict] = None, exclude: List[dict] = None, max_output: int = 1000000):
+    """
+    Pool initializer of :func:`iter_steady_states`: ships the network and the filters to each worker once instead of once per strategy.
+    """
+
+    _worker.update(primes=primes, include=include, exclude=exclude, max_output=max_output)
+
+
+def _steady_states_task(strategy: dict):
+    return strategy, steady_states_of_strategy(_worker["primes"], strategy, _worker["include"], _worker["exclude"], _worker["max_output"])
+
+
+# --- Reports ---------------------------------------------------------------------
+
+def format_state(state: dict) -> str:
+    """
+    Returns *state* as a report line, e.g. "AJ_b1:1, AJ_b2:0, FA_b1:0".
+    """
+
+    return ", ".join(f"{k}:{v}" for k, v in sorted(state.items()))
+
+
+def write_report_block(out: TextIO, strategy: dict, states: List[dict], project: List[str] = None):
+    """
+    Writes the block of one control strategy in the format of the "Steady States" reports.
+    Without *project* every state is listed after its count. With *project* the distinct projections
+    of the states on the variables of *project* are listed instead, without count.
+    """
+
+    out.write(SEPARATOR + "\n")
+    out.write(f"Control Strategy: {strategy}\n")
+    if project is None:
+        out.write(f"Number of matching states: {len(states)}\n")
+        lines = [format_state(x) for x in states]
+    else:
+        lines = list(dict.fromkeys(format_state({k: x[k] for k in project}) for x in states))
+    out.write(SEPARATOR + "\n")
+    for line in lines:
+        out.write(line + "\n")
+    out.write("\n")
+
+
+def write_json_record(out: TextIO, strategy: dict, states: List[dict]):
+    """
+    Writes one JSON line {"strategy": [[key, value], ...], "count": N, "states": [...]}. Edge keys become [source, target].
+    """
+
+    out.write(json.dumps({"strategy": list(strategy.items()), "count": len(states), "states": states}) + "\n")
+
+
+def write_steady_state_reports(results: Iterable[Tuple[dict, List[dict]]], report: str = None, json_file: str = None, projected_report: str = None, project: List[str] = None) -> int:
+    """
+    Streams the output of :func:`iter_steady_states` into the given files: the full text *report*,
+    the *projected_report* on the variables of *project*, and *json_file* (JSON lines). Returns the number of strategies written.
+    """
+
+    with ExitStack() as stack:
+        out = stack.enter_context(open(report, "w")) if report else None
+        out_json = stack.enter_context(open(json_file, "w")) if json_file else None
+        out_projected = stack.enter_context(open(projected_report, "w")) if projected_report else None
+        count = 0
+        for strategy, states in results:
+            if out:
+                write_report_block(out, strategy, states)
+            if out_json:
+                write_json_record(out_json, strategy, states)
+            if out_projected:
+                write_report_block(out_projected, strategy, states, project)
+            count = count + 1
+            log.info(f"{strategy}: {len(states)} matching states")
+    return count
+
+
+# --- Loading strategies and subspaces ------------------------------------------------
+
+def load_subspaces(spec: str) -> List[dict]:
+    """
+    Loads a list of subspaces (or control strategies) from *spec* = "FILE[:NAME,...]".
+    FILE is either a JSON file, a Python file with literal assignments, such as the results files written by the
+    enumerators ("cs = [...]"), or the directory of a :class:`result_store.ResultTable`.
+    NAME selects variables (default: "cs" for Python files, every list for JSON objects); it is ignored for tables.
+    Nested lists, e.g. phenotypes given as lists of subspaces, are flattened.
+
+    **example**::
+        >>> load_subspaces("parallel_node_control.py:E1,H1,H2,H3,M1,M2,M3,UN")
+    """
+
+    path, _, names = spec.partition(":")
+    names = [x for x in names.split(",") if x]
+    if os.path.isdir(path):
+        return ResultTable(path).load()
+    if path.endswith(".json"):
+        with open(path) as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = [data[x] for x in names] if names else [x for x in data.values() if isinstance(x, list)]
+    else:
+        with open(path) as f:
+            tree = ast.parse(f.read())
+        assigned = {t.id: node.value for node in tree.body if isinstance(node, ast.Assign) for t in node.targets if isinstance(t, ast.Name)}
+        data = [ast.literal_eval(assigned[x]) for x in (names or ["cs"])]
+    return list(_flatten(data))
+
+
+def _flatten(data) -> Iterator[dict]:
+    if isinstance(data, dict):
+        yield data
+    else:
+        for x in data:
+            yield from _flatten(x)
+
+
+def load_network(network: str) -> dict:
+    """
+    Returns the primes of a *network* given as a .bnet file or as the name of a network of the pyboolnet repository.
+    """
+
+    return bnet2primes(network) if os.path.exists(network) else get_primes(network)
+
+
+# --- Command line --------------------------------------------------------------------
+
+EXAMPLE = """example, the "No_Pheno" reports of the EMT network:
+  python steady_states.py selvaggio_emt results.py --exclude parallel_node_control.py:E1,H1,H2,H3,M1,M2,M3,UN \\
+      --report No_Pheno_sorted_by_cs.txt --projected-report No_Pheno_AJ_FA.txt --project AJ_b1,AJ_b2,FA_b1,FA_b2,FA_b3 \\
+      --json No_Pheno.jsonl --jobs 4"""
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Steady states under each control strategy, as text report and JSON lines.", epilog=EXAMPLE, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("network", help="pyboolnet repository name or .bnet file")
+    parser.add_argument("strategies", help="FILE[:NAME,...] with the control strategies (JSON or Python results file)")
+    parser.add_argument("--include", help="FILE[:NAME,...]: keep only steady states in one of these subspaces")
+    parser.add_argument("--exclude", help="FILE[:NAME,...]: drop steady states in one of these subspaces, e.g. the phenotypes")
+    parser.add_argument("--report", help="text report with every matching state")
+    parser.add_argument("--projected-report", help="text report with the distinct projections on --project")
+    parser.add_argument("--project", help="comma separated variables for --projected-report")
+    parser.add_argument("--json", help="JSON lines output")
+    parser.add_argument("--jobs", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--max-output", type=int, default=1000000, help="maximal number of steady states per strategy")
+    args = parser.parse_args(argv)
+
+    if args.projected_report and not args.project:
+        parser.error("--projected-report needs --project")
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    primes = load_network(args.network)
+    strategies = load_subspaces(args.strategies)
+    include = load_subspaces(args.include) if args.include else None
+    exclude = load_subspaces(args.exclude) if args.exclude else None
+    project = args.project.split(",") if args.project else None
+
+    results = iter_steady_states(primes, strategies, include, exclude, args.jobs, args.max_output)
+    count = write_steady_state_reports(results, args.report, args.json, args.projected_report, project)
+    print(f"{count} control strategies written")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional
+
+log = logging.getLogger(__name__)
+
+# --- Containment ----------------------------------------------------------------
+
+def is_included_in_subspace(subspace1: dict, subspace2: dict) -> bool:
+    """
+    Test whether *subspace1* is contained in *subspace2*, i.e. whether every variable fixed in *subspace2*
+    has the same value in *subspace1*. For control strategies this reads "*subspace1* is a superset of the
+    intervention *subspace2*".
+
+    **arguments**:
+        * *subspace1*, *subspace2* (dicts): subspaces.
+    **returns**:
+        * Answer (bool): whether *subspace1* is contained in *subspace2*.
+    **example**::
+        >>> is_included_in_subspace({'v1': 0, 'v2': 1}, {'v2': 1})
+        True
+    """
+
+    return all(x in subspace1 and subspace1[x] == subspace2[x] for x in subspace2.keys())
+
+
+class Subspace:
+    """
+    A subspace as two integer bitmasks: bit i of *fixed* says that variable i is fixed, bit i of *values* gives its value.
+    Bit positions are assigned by the :class:`SubspaceIndex` the subspace belongs to.
+    """
+
+    __slots__ = ("fixed", "values")
+
+    def __init__(self, fixed: int = 0, values: int = 0):
+        self.fixed, self.values = fixed, values & fixed
+
+    def is_included_in(self, other: "Subspace") -> bool:
+        """Bitmask version of :func:`is_included_in_subspace`."""
+        return other.fixed & ~self.fixed == 0 and (self.values ^ other.values) & other.fixed == 0
+
+    def __eq__(self, other):
+        return isinstance(other, Subspace) and self.fixed == other.fixed and self.values == other.values
+
+    def __hash__(self):
+        return hash((self.fixed, self.values))
+
+    def __len__(self):
+        return bin(self.fixed).count("1")
+
+    def __repr__(self):
+        return f"Subspace(fixed={self.fixed:#x}, values={self.values:#x})"
+
+
+# --- Subsumption index ------------------------------------------------------------
+
+class SubspaceIndex:
+    """
+    A growing set of subspaces (dicts) that answers the two containment queries of the enumerators without scanning it:
+
+        * :meth:`has_superspace`: is some stored subspace S such that *sub* is included in S, i.e. is a stored control strategy
+          a subset of the candidate? The submasks of *sub* are looked up in a hash set, which costs 2^len(sub) lookups
+          independently of the number of stored subspaces (with a linear bitmask scan if that is cheaper).
+        * :meth:`included_in`: which stored subspaces are included in *sub*, e.g. which trap spaces lie inside a subspace?
+          Answered by intersecting one bitset (over the stored subspaces) per literal of *sub*.
+
+    Keys can be any hashable (node names, edges); bit positions are assigned as keys are first seen.
+
+    **example**::
+        >>> found = SubspaceIndex([{'v1': 1}])
+        >>> found.has_superspace({'v1': 1, 'v2': 0})
+        True
+        >>> found.included_in({'v1': 1})
+        [{'v1': 1}]
+    """
+
+    def __init__(self, subspaces: Iterable[dict] = ()):
+        self.bits: Dict = {}
+        self.items: List[dict] = []
+        self.codes = set()
+        self.literals: Dict = {}  # (key, value) -> bitset over the positions in *items*
+        for sub in subspaces:
+            self.add(sub)
+
+    def __len__(self):
+        return len(self.items)
+
+    def encode(self, sub: dict, grow: bool = False) -> Optional[Subspace]:
+        """
+        Returns *sub* as a :class:`Subspace`. Keys never seen before get a new bit if *grow* is True,
+        otherwise they are left out of the code.
+        """
+
+        fixed = values = 0
+        for key, value in sub.items():
+            bit = self.bits.get(key)
+            if bit is None:
+                if not grow:
+                    continue
+                bit = self.bits[key] = len(self.bits)
+            fixed |= 1 << bit
+            if value:
+                values |= 1 << bit
+        return Subspace(fixed, values)
+
+    def add(self, sub: dict):
+        code = self.encode(sub, grow=True)
+        if code in self.codes:
+            return
+        self.codes.add(code)
+        position = 1 << len(self.items)
+        self.items.append(sub)
+        for literal in sub.items():
+            self.literals[literal] = self.literals.get(literal, 0) | position
+
+    def has_superspace(self, sub: dict) -> bool:
+        """Whether is_included_in_subspace(*sub*, S) holds for some stored S."""
+
+        code = self.encode(sub)
+        if 1 << len(code) > len(self.codes):
+            return any(code.is_included_in(s) for s in self.codes)
+        fixed, values, mask = code.fixed, code.values, code.fixed
+        while True:
+            if Subspace(mask, values) in self.codes:
+                return True
+            if not mask:
+                return False
+            mask = (mask - 1) & fixed
+
+    def included_in(self, sub: dict) -> List[dict]:
+        """The stored S with is_included_in_subspace(S, *sub*), in insertion order."""
+
+        return list(self._iter_included_in(sub))
+
+    def any_included_in(self, sub: dict) -> bool:
+        """Whether is_included_in_subspace(S, *sub*) holds for some stored S."""
+
+        return next(self._iter_included_in(sub), None) is not None
+
+    def _iter_included_in(self, sub: dict) -> Iterator[dict]:
+        hits = (1 << len(self.items)) - 1
+        for literal in sub.items():
+            hits &= self.literals.get(literal, 0)
+            if not hits:
+                return
+        while hits:
+            low = hits & -hits
+            yield self.items[low.bit_length() - 1]
+            hits ^= low
@@ -0,0 +1,81 @@
+import logging
+from itertools import chain
+from typing import List
+
+try:
+    from dd.cudd import BDD
+except ImportError:  # the pure-Python manager of the same package
+    try:
+        from dd.autoref import BDD
+    except ImportError:
+        BDD = None
+
+log = logging.getLogger(__name__)
+
+UPDATES = ("asynchronous", "synchronous")
+
+# --- Symbolic state transition graph -------------------------------------------------
+
+class SymbolicNetwork:
+    """
+    The update functions of *primes* as BDDs of one manager (CUDD through dd.cudd if available, else dd.autoref),
+    with the predecessor operator of the asynchronous or synchronous state transition graph. No transition relation over
+    primed variables is built: an asynchronous predecessor differs in one variable v with f_v != v, which is a cofactor of
+    the successor set, and the synchronous predecessors are the successor set composed with the update functions.
+    Built once per network, then queried for any number of targets.
+    """
+
+    def __init__(self, primes: dict, update: str = "asynchronous"):
+        if BDD is None: raise ImportError("The BDD model checker needs the dd package (pip install dd).")
+        if update not in UPDATES: raise ValueError(f"Update {update} is not supported by the BDD model checker, expected one of {UPDATES}.")
+        self.primes, self.update = primes, update
+        self.bdd = BDD()
+        if primes: self.bdd.declare(*primes)
+        self.vars = {v: self.bdd.var(v) for v in primes}
+        self.functions = {v: self.subspaces(primes[v][1]) for v in primes}
+
+    def subspaces(self, subs: List[dict]):
+        """The BDD of the union of the subspaces *subs* (e.g. the prime implicants of a function)."""
+        union = self.bdd.false
+        for sub in subs:
+            cube = self.bdd.true
+            for v, x in sub.items(): cube &= self.vars[v] if x else ~self.vars[v]
+            union |= cube
+        return union
+
+    def pre(self, states):
+        """The states with a successor in *states* (self-loops of steady states aside)."""
+        if self.update == "synchronous": return self.bdd.let(self.functions, states) if self.functions else states
+        pre = self.bdd.false
+        for v, f in self.functions.items():
+            x = self.vars[v]
+            pre |= (~x & f & self.bdd.let({v: True}, states)) | (x & ~f & self.bdd.let({v: False}, states))
+        return pre
+
+    def reach_backward(self, states):
+        """EF *states*: the states from which *states* can be reached, by a frontier fixpoint of :meth:`pre`."""
+        reached = frontier = states
+        while frontier != self.bdd.false:
+            frontier = self.pre(frontier) & ~reached
+            reached |= frontier
+        return reached
+
+    def efag(self, target: List[dict]) -> bool:
+        """Whether EF(AG(target)) holds in every state, i.e. model_checking(primes, update, "INIT TRUE", "CTLSPEC EF(AG(...))")."""
+        stay = ~self.reach_backward(~self.subspaces(target))  # AG target = not EF not target
+        return stay != self.bdd.false and self.reach_backward(stay) == self.bdd.true
+
+def cone_of_influence(primes: dict, roots) -> dict:
+    """The sub-network of *primes* that *roots* depend on (what NuSMV keeps with -coi)."""
+    seen, todo = set(roots), list(roots)
+    while todo:
+        for p in chain.from_iterable(primes[todo.pop()]):
+            todo.extend(u for u in p if u not in seen); seen.update(p)
+    return {v: primes[v] for v in primes if v in seen}
+
+def efag_holds(primes: dict, update: str, target: List[dict]) -> bool:
+    """
+    In-process replacement of the NuSMV query EF(AG(target)) from all states, see :class:`SymbolicNetwork`.
+    Only the cone of influence of the target variables is encoded, the other variables do not change the verdict.
+    """
+    return SymbolicNetwork(cone_of_influence(primes, {v for t in target for v in t}), update).efag(target)
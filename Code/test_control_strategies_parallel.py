@@ -0,0 +1,68 @@
+import random, threading, time
+from pyboolnet.model_checking import model_checking
+from pyboolnet.repository import get_primes
+from checkpoint import Checkpoint
+from control_strategies_parallel import (CandidateRanks, EFAG_set_of_subspaces, _model_checking_until, _restored_level,
+                                         _unresolved_ranges, iter_candidates)
+
+E1 = [{"AJ_b1": 1, "AJ_b2": 1, "FA_b1": 0, "FA_b2": 0, "FA_b3": 0}]
+
+
+def test_model_checking_until_agrees_with_model_checking():
+    primes = get_primes("raf")
+    for target in ([{"Raf": 0}], [{"Raf": 1}], [{"Raf": 0}, {"Raf": 1}]):
+        for update in ("asynchronous", "synchronous"):
+            spec = "CTLSPEC " + EFAG_set_of_subspaces(primes, target)
+            expected = model_checking(primes, update, "INIT TRUE", spec)
+            assert _model_checking_until(primes, update, spec, threading.Event()) == expected, (target, update)
+    assert _model_checking_until(primes, "asynchronous", "CTLSPEC " + EFAG_set_of_subspaces(primes, [{"Raf": 0}, {"Raf": 1}]), threading.Event())
+
+
+def test_model_checking_until_stops():
+    primes = get_primes("selvaggio_emt")  # the unreduced network takes NuSMV minutes
+    spec = "CTLSPEC " + EFAG_set_of_subspaces(primes, E1)
+    stop = threading.Event()
+    threading.Timer(0.5, stop.set).start()
+    start = time.monotonic()
+    assert _model_checking_until(primes, "asynchronous", spec, stop) is None
+    assert time.monotonic() - start < 10
+    assert _model_checking_until(primes, "asynchronous", spec, stop) is None  # already stopped
+
+
+def test_ranks_follow_iter_candidates():
+    rnd = random.Random(0)
+    for n in range(9):
+        cand_vars = [f"v{i}" for i in range(n)]
+        for size in range(min(n, 3) + 1):
+            for values in (None, {v: rnd.choice([(0,), (1,), (0, 1)]) for v in cand_vars}):
+                common = {"c": 1} if size % 2 else {}
+                ranks = CandidateRanks(cand_vars, size, common, values)
+                expected = list(iter_candidates(cand_vars, size, common, values))
+                assert ranks.total == len(expected)
+                assert [ranks.unrank(r) for r in range(ranks.total)] == expected
+                assert [ranks.rank(c) for c in expected] == list(range(ranks.total))
+                first, last = sorted(rnd.choices(range(ranks.total + 1), k=2))
+                assert list(ranks.iter_range(first, last)) == expected[first:last]
+
+
+def test_unresolved_ranges_skip_resolved_ranks():
+    rnd = random.Random(1)
+    levels = [CandidateRanks([f"v{i}" for i in range(6)], size, {}) for size in range(4)]
+    candidates = [c for ranks in levels for c in iter_candidates(ranks.cand_vars, ranks.size, {})]
+    for _ in range(50):
+        ckpt = Checkpoint(None, ())
+        for idx in rnd.sample(range(len(candidates)), rnd.randint(0, len(candidates))): ckpt.resolve(idx)
+        unresolved, offset = [], 0
+        for ranks in levels:
+            unresolved += [offset + r for first, last in _unresolved_ranges(ckpt, offset, ranks.total) for r in range(first, last)]
+            offset += ranks.total
+        assert unresolved == [idx for idx, _ in ckpt.stream(candidates)]
+
+
+def test_restored_level_keeps_the_other_strategies():
+    ranks = CandidateRanks(["v1", "v2", "v3"], 2, {})
+    known, smaller = [{"v1": 1}], [{"v2": 0}]
+    restored = [ranks.unrank(7), ranks.unrank(2)]
+    strategies = known + [restored[0]] + smaller + [restored[1]]
+    assert _restored_level(strategies, len(known), ranks) == [(7, restored[0]), (2, restored[1])]
+    assert strategies == known + smaller + restored
@@ -0,0 +1,54 @@
+import random
+import numpy as np
+import pytest
+from pyboolnet.prime_implicants import find_constants, percolate, remove_variables
+from pyboolnet.repository import get_primes
+from benchmark import random_network
+from percolation_engine import PercolationEngine
+
+NETWORKS = [("selvaggio_emt", lambda: get_primes("selvaggio_emt"))] + \
+           [(f"random_{n}_{seed}", lambda n=n, seed=seed: random_network(n, 3, seed)) for n, seed in ((12, 0), (20, 1), (30, 2))]
+
+
+def candidates(primes: dict, count: int = 40, seed: int = 0) -> list:
+    rnd = random.Random(seed)
+    names = list(primes)
+    cands = [{}]
+    for _ in range(count):
+        vs = rnd.sample(names, rnd.randint(1, min(4, len(names))))
+        cands.append({v: rnd.randint(0, 1) for v in vs})
+    return cands
+
+
+def normalized(primes: dict) -> dict:
+    return {v: [sorted(sorted(p.items()) for p in primes[v][k]) for k in (0, 1)] for v in primes}
+
+
+def reference_reduce(primes: dict, sub: dict, keep: list) -> dict:
+    """fix_components_and_reduce as it was written on pyboolnet."""
+    p = percolate(primes, add_constants=sub, copy=True)
+    return remove_variables(p, [k for k in find_constants(p) if k not in keep], copy=True)
+
+
+@pytest.mark.parametrize("name,load", NETWORKS, ids=[n for n, _ in NETWORKS])
+def test_engine_agrees_with_pyboolnet(name, load):
+    primes = load()
+    engine = PercolationEngine(primes)
+    cands = candidates(primes)
+    rnd = random.Random(1)
+    for cand in cands:
+        expected = find_constants(percolate(primes, add_constants=cand, copy=True))
+        assert engine.percolate(cand) == expected, cand
+        keep = rnd.sample(list(primes), 2)
+        assert normalized(engine.reduce(cand, keep)) == normalized(reference_reduce(primes, cand, keep)), cand
+
+
+@pytest.mark.parametrize("name,load", NETWORKS, ids=[n for n, _ in NETWORKS])
+def test_batch_agrees_with_percolate(name, load):
+    primes = load()
+    engine = PercolationEngine(primes)
+    cands = candidates(primes, count=150, seed=2)
+    matrix = engine.percolate_batch(cands, chunk=64)  # several blocks, the last one partial
+    assert matrix.shape == (len(cands), len(primes))
+    assert engine.decode_batch(matrix) == [engine.percolate(c) for c in cands]
+    assert np.array_equal(engine.percolate_batch([]), np.empty((0, len(primes)), np.int8))
@@ -0,0 +1,44 @@
+import os
+from main_control_edge_selvaggio_new import iter_node_edge_candidates, list_edges_from_primes
+from result_store import ResultStore, ResultTable, ROWS, SIZES
+
+# A -> B -> C, C -| A; no self-loops
+PRIMES = {
+    "A": [[{"C": 1}], [{"C": 0}]],
+    "B": [[{"A": 0}], [{"A": 1}]],
+    "C": [[{"B": 0}], [{"B": 1}]],
+}
+TARGET = [{"C": 1}]
+
+
+def test_store_edge_mode_output(tmp_path):
+    # Edge-only searches key the common variables as (k, k), also for nodes without a self-loop
+    edges = sorted(list_edges_from_primes(PRIMES, avoid_targets=["A"]))
+    strategies = list(iter_node_edge_candidates(edges, [1], {"A": 1}, "edge"))
+    assert all(("A", "A") in cs for cs in strategies)
+
+    table = ResultStore(str(tmp_path)).table(PRIMES, TARGET, "edge-model_checking", 2)
+    assert table.extend(strategies) == len(strategies)
+    table.close()
+
+    table = ResultTable(table.path)
+    assert table.load() == [dict(sorted(cs.items(), key=lambda x: table.bits[x[0]])) for cs in strategies]
+    assert len(table.load(contains={("A", "A"): 1})) == len(strategies)
+
+
+def test_reader_keeps_partial_row(tmp_path):
+    table = ResultStore(str(tmp_path)).table(PRIMES, TARGET, "node-model_checking", 2)
+    table.extend([{"A": 1}, {"B": 0}])
+    table.close()
+    with open(os.path.join(table.path, ROWS), "ab") as f: f.write(b"\0" * 8)  # a row the writer has half written
+    sizes = os.path.getsize(os.path.join(table.path, ROWS))
+
+    reader = ResultTable(table.path)
+    assert reader.load() == [{"A": 1}, {"B": 0}]
+    assert os.path.getsize(os.path.join(table.path, ROWS)) == sizes
+
+    writer = ResultTable(table.path)
+    assert writer.append({"C": 1})
+    writer.close()
+    assert ResultTable(table.path).load() == [{"A": 1}, {"B": 0}, {"C": 1}]
+    assert os.path.getsize(os.path.join(table.path, SIZES)) == 3
@@ -0,0 +1,41 @@
+import random
+from subspaces import SubspaceIndex, is_included_in_subspace
+
+KEYS = ["v1", "v2", "v3", "v4", "v5", "v6", ("v1", "v2"), ("v3", "v3")]
+
+
+def random_subspace(rnd: random.Random, keys: list = KEYS, max_size: int = 4) -> dict:
+    return {k: rnd.randint(0, 1) for k in rnd.sample(keys, rnd.randint(0, max_size))}
+
+
+def test_index_agrees_with_linear_scan():
+    rnd = random.Random(0)
+    for trial in range(200):
+        stored = [random_subspace(rnd) for _ in range(rnd.randint(0, 30))]
+        if trial % 3 == 0: stored.append({})
+        index = SubspaceIndex(stored)
+        unique = [s for i, s in enumerate(stored) if s not in stored[:i]]
+        queries = [random_subspace(rnd, KEYS + ["new"], 6) for _ in range(40)] + [{}] + stored[:5]
+        for sub in queries:
+            assert index.has_superspace(sub) == any(is_included_in_subspace(sub, s) for s in stored), (stored, sub)
+            assert index.included_in(sub) == [s for s in unique if is_included_in_subspace(s, sub)], (stored, sub)
+            assert index.any_included_in(sub) == any(is_included_in_subspace(s, sub) for s in stored), (stored, sub)
+
+
+def test_growing_index():
+    # Keys first seen after a query must not change earlier answers, as in the enumerators that add strategies as they go
+    rnd = random.Random(1)
+    index, stored = SubspaceIndex(), []
+    for _ in range(300):
+        sub = random_subspace(rnd)
+        assert index.has_superspace(sub) == any(is_included_in_subspace(sub, s) for s in stored)
+        index.add(sub); stored.append(sub)
+        assert index.has_superspace(sub) and index.any_included_in(sub)
+
+
+def test_empty_subspace():
+    assert not SubspaceIndex().has_superspace({})
+    assert SubspaceIndex().included_in({"v1": 1}) == []
+    assert SubspaceIndex([{}]).has_superspace({"v1": 0})
+    assert SubspaceIndex([{}]).included_in({}) == [{}]
+    assert SubspaceIndex([{"v1": 1}]).included_in({}) == [{"v1": 1}]
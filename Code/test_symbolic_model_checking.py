@@ -0,0 +1,71 @@
+import json, os, random
+import pytest
+from pyboolnet.model_checking import model_checking
+from pyboolnet.prime_implicants import create_constants
+from pyboolnet.repository import get_primes
+from benchmark import random_target
+from control_strategies_parallel import EFAG_set_of_subspaces, fix_components_and_reduce
+from symbolic_model_checking import efag_holds
+
+pytest.importorskip("dd")
+
+RESULTS = os.path.join(os.path.dirname(__file__), "..", "EMT control results", "Node Control")
+E1 = [{"AJ_b1": 1, "AJ_b2": 1, "FA_b1": 0, "FA_b2": 0, "FA_b3": 0}]
+AVOID_H = [{"AJ_b1": 0, "AJ_b2": 0}, {"FA_b1": 0, "FA_b2": 0, "FA_b3": 0}]
+
+
+def nusmv(primes: dict, update: str, target: list) -> bool:
+    return model_checking(primes, update, "INIT TRUE", "CTLSPEC " + EFAG_set_of_subspaces(primes, target))
+
+
+def stored_strategies(phenotype: str, count: int) -> list:
+    with open(os.path.join(RESULTS, f"selvaggio_emt_node_{phenotype}.json")) as f:
+        return [cs for group in json.load(f).values() for cs in group][:count]
+
+
+def emt_queries():
+    """Reduced EMT networks of stored E1 strategies and of the same strategies minus one intervention, each with a few
+    random extra interventions so that the reduced networks are not trivial (verdicts true and false)."""
+    primes = get_primes("selvaggio_emt")
+    keep = list(E1[0])
+    others = [v for v in primes if v not in keep]
+    rnd = random.Random(0)
+    for cs in stored_strategies("E1", 3):
+        for cand in (dict(cs), dict(list(cs.items())[1:])):
+            cand.update({v: rnd.randint(0, 1) for v in rnd.sample([v for v in others if v not in cs], 4)})
+            reduced = fix_components_and_reduce(primes, cand, keep=keep)
+            yield reduced, E1
+            yield reduced, AVOID_H
+
+
+@pytest.mark.parametrize("update", ["asynchronous", "synchronous"])
+def test_efag_agrees_with_nusmv_on_emt(update):
+    verdicts = []
+    for primes, target in emt_queries():
+        expected = nusmv(primes, update, target)
+        assert efag_holds(primes, update, target) == expected, (primes.keys(), target)
+        verdicts.append(expected)
+    assert any(verdicts) and not all(verdicts)
+
+
+@pytest.mark.parametrize("update", ["asynchronous", "synchronous"])
+def test_efag_agrees_with_nusmv_on_raf(update):
+    primes = get_primes("raf")
+    for target in ([{"Raf": 0}], [{"Raf": 1}], [{"Raf": 0, "Mek": 1}, {"Erk": 1}]):
+        assert efag_holds(primes, update, target) == nusmv(primes, update, target), target
+        for cand in ({"Erk": 0}, {"Erk": 1}, {"Mek": 1, "Raf": 0}):
+            controlled = create_constants(primes, cand, copy=True)
+            assert efag_holds(controlled, update, target) == nusmv(controlled, update, target), (cand, target)
+
+
+@pytest.mark.parametrize("network", ["remy_tumorigenesis", "dahlhaus_neuroplastoma"])
+@pytest.mark.parametrize("update", ["asynchronous", "synchronous"])
+def test_efag_agrees_with_nusmv_on_reduced_networks(network, update):
+    # The unreduced networks take NuSMV minutes, so only candidates that fix a good part of them are checked
+    primes = get_primes(network)
+    rnd = random.Random(network)
+    for seed in range(6):
+        target = random_target(primes, 2, seed)
+        cand = {v: rnd.randint(0, 1) for v in rnd.sample([v for v in primes if v not in target[0]], 6)}
+        reduced = fix_components_and_reduce(primes, cand, keep=list(target[0]))
+        assert efag_holds(reduced, update, target) == nusmv(reduced, update, target), (cand, target)
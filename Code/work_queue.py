@@ -0,0 +1,227 @@
+import argparse, importlib, io, itertools, logging, multiprocessing, os, pickle, socket, sys, threading, time
+from collections import deque
+from concurrent.futures import Executor, Future
+from multiprocessing.connection import Client, Listener
+from typing import Callable, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+HEARTBEAT = 5.0   # seconds between the liveness messages of a worker
+TIMEOUT = 60.0    # a worker silent for this long is lost and its unfinished tasks go to other workers
+CHUNK = 4         # tasks handed to a worker at once
+
+# --- Wire format ------------------------------------------------------------------------
+#
+# coordinator -> worker: ("init", initializer, initargs), ("chunk", chunk_id, [(task_id, fn, args)]), ("stop",)
+# worker -> coordinator: ("hello", host, pid), ("heartbeat",), ("result", chunk_id, task_id, ok, value)
+
+def _import_attr(module: str, qualname: str):
+    obj = importlib.import_module(module)
+    for name in qualname.split("."): obj = getattr(obj, name)
+    return obj
+
+class _Pickler(pickle.Pickler):
+    """Sends the functions of the __main__ script by the script's module name, so that workers import them from the same file."""
+
+    def reducer_override(self, obj):
+        if getattr(obj, "__module__", None) == "__main__" and callable(obj) and hasattr(obj, "__qualname__"):
+            main = getattr(sys.modules["__main__"], "__file__", None)
+            if main: return _import_attr, (os.path.splitext(os.path.basename(main))[0], obj.__qualname__)
+        return NotImplemented
+
+def _send(conn, message, lock: Optional[threading.Lock] = None):
+    buf = io.BytesIO()
+    _Pickler(buf, pickle.HIGHEST_PROTOCOL).dump(message)
+    if lock is None: conn.send_bytes(buf.getvalue()); return
+    with lock: conn.send_bytes(buf.getvalue())
+
+def _recv(conn):
+    return pickle.loads(conn.recv_bytes())
+
+def _key(authkey: Optional[bytes]) -> bytes:
+    """*authkey*, else $CONTROL_CLUSTER_KEY, else the key this process shares with its forked children."""
+    if authkey: return authkey
+    env = os.environ.get("CONTROL_CLUSTER_KEY")
+    return env.encode() if env else bytes(multiprocessing.current_process().authkey)
+
+# --- Coordinator ------------------------------------------------------------------------
+
+class _Task:
+    __slots__ = ("id", "fn", "args", "future")
+
+    def __init__(self, id, fn, args, future):
+        self.id, self.fn, self.args, self.future = id, fn, args, future
+
+class ClusterExecutor(Executor):
+    """
+    A concurrent.futures executor whose workers are processes on any machine that connect to *address*
+    (multiprocessing.connection with *authkey*), so the parallel enumerators run on a cluster through the same
+    dispatch loop as with a local pool: superset pruning and checkpoints stay in the coordinator. Each worker runs
+    *initializer(*initargs)* once, then takes *chunk* tasks at a time and streams the results back. A worker that disconnects or sends nothing (not even a heartbeat) for *timeout* seconds is
+    dropped and its unfinished tasks are handed out again; a late duplicate result is ignored.
+    *local_workers* starts that many worker processes on this machine, e.g. to test a cluster on one host.
+
+    **example**::
+        >>> with ClusterExecutor(("0.0.0.0", 6000), b"secret", init_worker, (primes, target, update)) as exe:
+        ...     dispatch(exe, cache, target, update, stream, strategies, window, ckpt)
+        $ python work_queue.py worker --connect coordinator:6000 --processes 16   # on every node, CONTROL_CLUSTER_KEY=secret
+    """
+
+    def __init__(self, address: Tuple[str, int] = ("127.0.0.1", 0), authkey: Optional[bytes] = None, initializer: Callable = None,
+                 initargs: tuple = (), chunk: int = CHUNK, timeout: float = TIMEOUT, local_workers: int = 0):
+        self.initializer, self.initargs, self.chunk, self.timeout = initializer, initargs, chunk, timeout
+        self._authkey = _key(authkey)
+        self._listener = Listener(address, authkey=self._authkey)
+        self.address = self._listener.address
+        self._queue, self._cond = deque(), threading.Condition()
+        self._ids, self._shutdown, self._handlers = itertools.count(), False, []
+        self.workers = {}  # name -> number of tasks done, of the connected workers
+        ctx = multiprocessing.get_context("fork")  # before any thread is started
+        self._local = [ctx.Process(target=run_worker, args=(self.address, self._authkey), daemon=True) for _ in range(local_workers)]
+        for proc in self._local: proc.start()
+        threading.Thread(target=self._accept, name="cluster-accept", daemon=True).start()
+        log.info(f"Waiting for workers on {self.address[0]}:{self.address[1]}")
+
+    def submit(self, fn, *args, **kwargs):
+        if kwargs: raise TypeError("ClusterExecutor.submit takes positional arguments only.")
+        future = Future()
+        with self._cond:
+            if self._shutdown: raise RuntimeError("cannot submit after shutdown")
+            self._queue.append(_Task(next(self._ids), fn, args, future))
+            self._cond.notify()
+        return future
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        with self._cond:
+            self._shutdown = True
+            if cancel_futures:
+                while self._queue: self._queue.popleft().future.cancel()
+            self._cond.notify_all()
+        self._listener.close()
+        if wait:
+            for thread in self._handlers: thread.join()
+            for proc in self._local: proc.join()
+
+    def _accept(self):
+        while True:
+            try: conn = self._listener.accept()
+            except (OSError, EOFError, multiprocessing.AuthenticationError) as e:  # closed by shutdown, or a client with the wrong key
+                if self._shutdown: return
+                log.warning(f"Rejected a worker: {e}"); continue
+            thread = threading.Thread(target=self._serve, args=(conn,), daemon=True)
+            self._handlers.append(thread); thread.start()
+
+    def _take(self) -> Optional[List[_Task]]:
+        """Up to *chunk* tasks to run (re-dispatched ones first); None once shut down and drained."""
+        with self._cond:
+            while True:
+                tasks = []
+                while self._queue and len(tasks) < self.chunk:
+                    task = self._queue.popleft()
+                    if task.future.running() or task.future.set_running_or_notify_cancel(): tasks.append(task)
+                if tasks: return tasks
+                if self._shutdown: return None
+                self._cond.wait()
+
+    def _serve(self, conn):
+        name, pending = "?", {}
+        try:
+            if not conn.poll(self.timeout): raise TimeoutError("no hello")
+            _, host, pid = _recv(conn)
+            name = f"{host}:{pid}"
+            self.workers[name] = 0
+            log.info(f"Worker {name} connected")
+            _send(conn, ("init", self.initializer, self.initargs))
+            while True:
+                tasks = self._take()
+                if tasks is None: break
+                cid = next(self._ids)
+                pending = {t.id: t for t in tasks}
+                _send(conn, ("chunk", cid, [(t.id, t.fn, t.args) for t in tasks]))
+                while pending:
+                    if not conn.poll(self.timeout): raise TimeoutError(f"silent for {self.timeout:.0f}s")
+                    message = _recv(conn)
+                    if message[0] != "result": continue
+                    _, _, tid, ok, value = message
+                    task = pending.pop(tid, None)
+                    if task is None or task.future.done(): continue
+                    if ok: task.future.set_result(value)
+                    else: task.future.set_exception(value)
+                    self.workers[name] += 1
+            _send(conn, ("stop",))
+        except (EOFError, OSError, TimeoutError, pickle.UnpicklingError) as e:
+            reason = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            if pending: log.warning(f"Lost worker {name} ({reason}), re-dispatching {len(pending)} tasks")
+            else: log.info(f"Worker {name} left ({reason})")
+            with self._cond:
+                self._queue.extendleft(t for t in pending.values() if not t.future.done())
+                self._cond.notify_all()
+        finally:
+            self.workers.pop(name, None)
+            conn.close()
+
+# --- Worker -----------------------------------------------------------------------------
+
+def run_worker(address: Tuple[str, int], authkey: Optional[bytes] = None, heartbeat: float = HEARTBEAT, retry: float = 60.0):
+    """
+    Serve one coordinator until it says stop or goes away: run the initializer it sends, then its chunks of tasks,
+    sending every result as soon as it is known and a heartbeat every *heartbeat* seconds from a background thread.
+    Connecting is retried for *retry* seconds, so workers may start before the coordinator.
+    """
+    deadline = time.monotonic() + retry
+    while True:
+        try: conn = Client(tuple(address), authkey=_key(authkey)); break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline: raise
+            time.sleep(1.0)
+    lock, stop = threading.Lock(), threading.Event()
+
+    def beat():
+        while not stop.wait(heartbeat):
+            try: _send(conn, ("heartbeat",), lock)
+            except OSError: return
+
+    _send(conn, ("hello", socket.gethostname(), os.getpid()), lock)
+    threading.Thread(target=beat, daemon=True).start()
+    try:
+        while True:
+            message = _recv(conn)
+            if message[0] == "stop": return
+            if message[0] == "init":
+                _, initializer, initargs = message
+                if initializer is not None: initializer(*initargs)
+                continue
+            _, cid, tasks = message
+            for tid, fn, args in tasks:
+                try: result = (True, fn(*args))
+                except Exception as e: result = (False, e)
+                try: _send(conn, ("result", cid, tid) + result, lock)
+                except (pickle.PicklingError, TypeError, AttributeError) as e:  # an unpicklable result must not look like a lost worker
+                    _send(conn, ("result", cid, tid, False, RuntimeError(f"cannot send the result: {e}")), lock)
+    except EOFError:
+        log.info("Coordinator went away")
+    finally:
+        stop.set()
+        conn.close()
+
+def _parse_address(text: str) -> Tuple[str, int]:
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Worker node of a ClusterExecutor (the key is read from $CONTROL_CLUSTER_KEY).")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker", help="connect worker processes to a coordinator")
+    worker.add_argument("--connect", required=True, help="host:port of the coordinator")
+    worker.add_argument("--processes", type=int, default=max(1, (os.cpu_count() or 1) - 2))
+    worker.add_argument("--heartbeat", type=float, default=HEARTBEAT)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(message)s")
+    address = _parse_address(args.connect)
+    procs = [multiprocessing.Process(target=run_worker, args=(address, None, args.heartbeat)) for _ in range(args.processes)]
+    for proc in procs: proc.start()
+    for proc in procs: proc.join()
+
+if __name__ == "__main__":
+    main()